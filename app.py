@@ -5,101 +5,34 @@ import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import os
 import time
-import urllib.request
-import re
-from fpdf import FPDF
+import threading
+from storage import (
+    SQLiteStorage, OrderLog, StockLedger, open_sheets, missing_columns, stock_movement, opening_movements, compact_stock,
+    start_periodic_compaction, LEDGER_SHEET, SNAPSHOT_SHEET, MOVE_ISSUE, MOVE_ADJUST, sync_storage, start_periodic_sync, archive_closed_orders,
+    MAT_SHEET, ORD_SHEET, QUOTE_SHEET, ARCHIVE_SHEET, REORDER_SHEET, ORD_HEADERS, SHEET_NAMES, REAL_SHEET_URL, CATEGORY_COLUMNS
+)
+from core import (
+    SheetCache, SheetChangeDetector, ApplicabilityIndex, CAPACITY_MAP, PLAN_COLUMNS, MasterIndex,
+    CodeAllocator, generate_smart_code, to_int, receive_orders, explode_plan, plan_to_cart, plan_material_import,
+    match_cart_lines, build_order_rows, Cart, QuotePricer, build_quote_bom, QuoteIndex, Analytics,
+    ReorderEngine, reorder_point_row, reorder_to_cart, filter_frame
+)
+from write_queue import WriteBehindQueue
+from sheets_client import wrap_client
+from order_pdf import ensure_font_exists, render_order_pdf, render_orders_zip, order_pdf_filename
 
 # -----------------------------------------------------
-# 1. 시스템 설정 및 폰트
+# 1. 시스템 설정 (발주서 PDF 는 order_pdf.py, 매칭/입고 로직은 core.py)
 # -----------------------------------------------------
 st.set_page_config(page_title="베스트 화학 통합 ERP", layout="wide")
 
-FONT_FILE = "NanumGothic.ttf"
-
-def ensure_font_exists():
-    if not os.path.exists(FONT_FILE):
-        url = "https://github.com/google/fonts/raw/main/ofl/nanumgothic/NanumGothic-Regular.ttf"
-        try:
-            with st.spinner("한글 폰트 다운로드 중..."):
-                urllib.request.urlretrieve(url, FONT_FILE)
-        except: return False
-    return True
-
-# -----------------------------------------------------
-# 2. PDF 생성 클래스
-# -----------------------------------------------------
-class PDF(FPDF):
-    def header(self):
-        if os.path.exists(FONT_FILE):
-            self.add_font("NanumGothic", "", FONT_FILE, uni=True)
-            self.set_font("NanumGothic", "", 10)
-        else: self.set_font("Arial", "", 10)
-        
-        self.set_font_size(24)
-        try: self.cell(0, 15, "발    주    서", align="C", ln=True)
-        except: self.cell(0, 15, "ORDER SHEET", align="C", ln=True)
-        self.ln(5)
-
-    def footer(self):
-        self.set_y(-15)
-        if os.path.exists(FONT_FILE): self.set_font("NanumGothic", "", 8)
-        else: self.set_font("Arial", "", 8)
-        self.cell(0, 10, f'Page {self.page_no()}', align="C")
-
-def generate_order_pdf(supplier_info, order_items):
-    if not ensure_font_exists(): return None
-    pdf = PDF()
-    pdf.add_page()
-    pdf.set_font("NanumGothic", "", 11)
-
-    # 상단 정보
-    pdf.set_fill_color(240, 240, 240)
-    pdf.cell(30, 10, "  발  신  인", border=1, fill=True)
-    pdf.cell(160, 10, "  베스트화학기계공업(주)   (담당: 김송이 과장)", border=1, ln=True)
-    pdf.cell(30, 10, "  수  신  인", border=1, fill=True)
-    pdf.cell(60, 10, f"  {supplier_info['name']}", border=1)
-    pdf.cell(30, 10, "  F    A    X", border=1, fill=True)
-    pdf.cell(70, 10, f"  {supplier_info.get('fax', '')}", border=1, ln=True)
-    pdf.cell(30, 10, "  발  주  일", border=1, fill=True)
-    pdf.cell(160, 10, f"  {datetime.now().strftime('%Y년 %m월 %d일')}", border=1, ln=True)
-    pdf.ln(8)
-    
-    pdf.multi_cell(0, 6, "※ 베스트입니다. 다음과 같이 발주하고자 합니다.\n   오늘도 행복한 하루 보내세요. 감사합니다. ^^")
-    pdf.ln(5)
-
-    # 자재 목록
-    pdf.set_fill_color(220, 220, 220)
-    pdf.cell(15, 8, "No", border=1, align="C", fill=True)
-    pdf.cell(70, 8, "품  명", border=1, align="C", fill=True)
-    pdf.cell(50, 8, "규  격", border=1, align="C", fill=True)
-    pdf.cell(20, 8, "수 량", border=1, align="C", fill=True)
-    pdf.cell(35, 8, "비 고", border=1, align="C", fill=True, ln=True)
-    
-    total_qty = 0
-    for idx, item in enumerate(order_items):
-        qty = int(item['qty'])
-        total_qty += qty
-        pdf.cell(15, 8, str(idx+1), border=1, align="C")
-        pdf.cell(70, 8, str(item['name']), border=1, align="L")
-        pdf.cell(50, 8, str(item['spec']), border=1, align="C")
-        pdf.cell(20, 8, str(qty), border=1, align="C")
-        pdf.cell(35, 8, str(item.get('note', '')), border=1, align="L", ln=True)
-
-    pdf.cell(135, 8, "합    계", border=1, align="C")
-    pdf.cell(20, 8, str(total_qty), border=1, align="C")
-    pdf.cell(35, 8, "", border=1, ln=True)
-    pdf.ln(15)
-    
-    pdf.set_font_size(16)
-    pdf.cell(0, 10, "베스트화학기계공업(주)   (인)", align="R", ln=True)
-    
-    file_name = f"발주서_{supplier_info['name']}_{datetime.now().strftime('%y%m%d')}.pdf"
-    pdf.output(file_name)
-    return file_name
-
 # -----------------------------------------------------
 # 3. 구글 시트 연결
 # -----------------------------------------------------
+# 구글 API 사용자당 분당 요청 한도 (읽기/쓰기 각각)
+SHEETS_READS_PER_MIN = int(os.environ.get("SHEETS_READS_PER_MIN", "60"))
+SHEETS_WRITES_PER_MIN = int(os.environ.get("SHEETS_WRITES_PER_MIN", "60"))
+
 @st.cache_resource
 def init_connection():
     SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
@@ -113,172 +46,335 @@ def init_connection():
         creds_dict = json.load(open("service_account.json"))
 
     if creds_dict:
-        try:
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SCOPE)
-            return gspread.authorize(creds)
-        except: return None
+        # 인증 오류는 그대로 올려서 호출하는 쪽에서 원인을 표시 (실패 결과는 캐시되지 않음)
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SCOPE)
+        return wrap_client(gspread.authorize(creds), SHEETS_READS_PER_MIN, SHEETS_WRITES_PER_MIN)
     return None
 
-REAL_SHEET_URL = "https://docs.google.com/spreadsheets/d/1UQ6_OysueJ07m6Qc5ncfE1NxPCLjc255r6MeFdl0OHQ/edit?gid=1122897158#gid=1122897158"
+# 저장소 선택: sheets (기본) / sqlite (로컬 파일, SHEETS_SYNC_SECONDS 주기로 구글 시트에 동기화)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sheets")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "erp.db")
+SHEETS_SYNC_SECONDS = int(os.environ.get("SHEETS_SYNC_SECONDS", "0"))
 
-client = init_connection()
-if not client:
-    st.error("인증 실패")
-    st.stop()
-    
-try:
-    sh = client.open_by_url(REAL_SHEET_URL)
-    ws_mat = sh.worksheet("자재마스터")
-    ws_ord = sh.worksheet("발주내역")
-    try: ws_quote = sh.worksheet("견적DB")
-    except: 
-        ws_quote = sh.add_worksheet(title="견적DB", rows=100, cols=20)
-        ws_quote.append_row(["견적ID", "날짜", "설비", "용량", "메인", "서브", "방폭", "재질", "옵션", "총액"])
-except:
-    st.error("구글 시트 연결 실패")
-    st.stop()
+@st.cache_resource
+def open_sheets_storage(_client, url):
+    # 워크시트 목록은 메타데이터 조회 1회로 한꺼번에 (시트별 worksheet() 순차 호출 없음)
+    return open_sheets(_client, url)
+
+@st.cache_resource
+def open_sqlite_storage(path):
+    local = SQLiteStorage(path)
+    if SHEETS_SYNC_SECONDS > 0:
+        try: client = init_connection()
+        except Exception as e:
+            st.warning(f"구글 시트 동기화 비활성화 (인증 실패: {e})")
+            client = None
+        if client:
+            remote = open_sheets_storage(client, REAL_SHEET_URL)
+            # 처음 만든 로컬 DB 는 구글 시트 내용으로 채운 뒤, 이후로는 바뀐 시트만 양방향 동기화 (양쪽 다 바뀌면 로컬 우선)
+            if local.is_empty(): sync_storage(remote, local)
+            start_periodic_sync(local, remote, SHEETS_SYNC_SECONDS)
+    return local
+
+if STORAGE_BACKEND == "sqlite":
+    storage = open_sqlite_storage(SQLITE_PATH)
+else:
+    try: client = init_connection()
+    except Exception as e:
+        st.error(f"인증 실패: {e}")
+        st.stop()
+    if not client:
+        st.error("인증 실패: 서비스 계정 정보가 없습니다.")
+        st.stop()
+    try:
+        storage = open_sheets_storage(client, REAL_SHEET_URL)
+    except Exception as e:
+        st.error(f"구글 시트 연결 실패: {e}")
+        st.stop()
 
 # -----------------------------------------------------
-# 4. 유틸리티 함수
+# 3-1. 공용 데이터 캐시 (모든 세션 공유)
 # -----------------------------------------------------
-PREFIX_MAP = {
-    '모터': 'MTR', '감속기': 'MTR', '펌프': 'PMP', '베어링': 'BRG', '유니트': 'BRG',
-    '밸브': 'VLV', '파이프': 'PIP', '엘보': 'PIP', '티': 'PIP', '소켓': 'PIP',
-    '플랜지': 'FLG', '볼트': 'BLT', '너트': 'BLT', '인버터': 'ELC', '스위치': 'ELC',
-    '판': 'RAW', '앵글': 'RAW', '환봉': 'RAW', 'SUS': 'RAW', '씰': 'SEL'
-}
+@st.cache_resource
+def get_sheet_cache():
+    return SheetCache()
+
+# -----------------------------------------------------
+# 3-2. 원격 변경 감지 (시트에서 직접 수정한 내용 반영)
+# -----------------------------------------------------
+CHANGE_POLL_SECONDS = int(os.environ.get("CHANGE_POLL_SECONDS", "30"))
+
+@st.cache_resource
+def get_change_detector():
+    return SheetChangeDetector(CHANGE_POLL_SECONDS)
+
+sheet_cache = get_sheet_cache()
+change_detector = get_change_detector()
+
+def read_sheet(name):
+    change_detector.mark_loaded(storage, name)
+    return storage.read_frame(name)
+
+def load_sheet(name):
+    return sheet_cache.get(name, lambda: read_sheet(name))
+
+def load_materials():
+    return load_sheet(MAT_SHEET)
+
+@st.cache_resource
+def get_order_log():
+    return OrderLog()
+
+order_log = get_order_log()
 
-def generate_smart_code(supplier, name, spec):
-    sup_code = supplier[:2] if supplier else "XX"
-    item_code = "ETC"
-    for k, v in PREFIX_MAP.items():
-        if k in name:
-            item_code = v
-            break
-    spec_clean = re.sub(r'[^a-zA-Z0-9가-힣]', '', str(spec))
-    spec_code = spec_clean[:3].upper() if spec_clean else "000"
-    return f"{sup_code}-{item_code}-{spec_code}"
+def load_pending_orders():
+    """입고 대기 발주 행 (증분 로딩: 캐시가 무효화되면 새로 추가된 행만 읽음)"""
+    def _load():
+        change_detector.mark_loaded(storage, ORD_SHEET)
+        order_log.refresh(storage)
+        return order_log.pending_frame()
+    return sheet_cache.get(ORD_SHEET, _load)
+
+@st.cache_resource
+def get_quote_index():
+    return QuoteIndex()
+
+quote_index = get_quote_index()
+
+def load_quote_index():
+    """견적DB 유사 견적 색인 (증분 로딩: 캐시가 무효화되면 새로 추가된 견적 행만 읽음)"""
+    def _load():
+        change_detector.mark_loaded(storage, QUOTE_SHEET)
+        quote_index.refresh(storage)
+        return quote_index
+    return sheet_cache.load(QUOTE_SHEET, _load)
+
+@st.cache_resource
+def get_stock_ledger():
+    return StockLedger()
+
+stock_ledger = get_stock_ledger()
+
+def load_stock():
+    """자재코드별 현재재고 (스냅샷 + 재고이력 증분 합계, 캐시가 무효화되면 새 이력 행만 읽음)"""
+    def _load():
+        change_detector.mark_loaded(storage, LEDGER_SHEET)
+        stock_ledger.refresh(storage)
+        return stock_ledger.stock_frame()
+    return sheet_cache.get(LEDGER_SHEET, _load)
+
+@st.cache_resource
+def get_analytics():
+    return Analytics()
+
+analytics = get_analytics()
+
+def load_analytics():
+    """영업/구매 집계 - 원본 시트가 다시 로딩된 경우에만 새로 추가된 행을 읽어서 반영"""
+    load_quote_index(); load_pending_orders(); load_stock()
+    ord_version = sheet_cache.version(ORD_SHEET)
+    # 발주보관은 보관 처리(= 발주내역 변경) 때만 늘어나므로 발주내역 버전을 따라감
+    analytics.sync(storage, {QUOTE_SHEET: sheet_cache.version(QUOTE_SHEET), ORD_SHEET: ord_version,
+                             ARCHIVE_SHEET: ord_version, LEDGER_SHEET: sheet_cache.version(LEDGER_SHEET)})
+    return analytics
+
+@st.cache_resource
+def get_reorder_engine():
+    return ReorderEngine(stock_ledger, order_log)
+
+reorder_engine = get_reorder_engine()
+
+def load_code_rows():
+    """자재코드 -> (매입처, 품명, 규격) - 자재마스터가 다시 로딩될 때만 재생성"""
+    def _build(df_mat):
+        if not {'자재코드', '매입처', '품명', '규격'} <= set(df_mat.columns): return {}
+        cols = [df_mat[c].astype(str) for c in ('매입처', '품명', '규격')]
+        return dict(zip(df_mat['자재코드'].astype(str), zip(*cols)))
+    return sheet_cache.derive(MAT_SHEET, "codes", lambda: read_sheet(MAT_SHEET), _build)
+
+def load_low_stock():
+    """발주점 이하 자재 (재고 / 입고 대기 / 발주점이 바뀐 자재만 다시 판정)"""
+    load_stock(); load_pending_orders()
+    reorder_engine.sync(load_sheet(REORDER_SHEET), sheet_cache.version(REORDER_SHEET))
+    return reorder_engine.low_frame(load_code_rows())
+
+def stock_map():
+    stock = load_stock()
+    return dict(zip(stock['자재코드'], stock['현재재고']))
+
+def load_applicability_index():
+    """(자재마스터 DataFrame, 적용설비 역색인) - 자재마스터가 다시 로딩될 때만 재생성"""
+    def _build(df_mat):
+        return df_mat, ApplicabilityIndex(df_mat['적용설비'].tolist() if '적용설비' in df_mat.columns else [])
+    return sheet_cache.derive(MAT_SHEET, "applicability", lambda: read_sheet(MAT_SHEET), _build)
+
+def load_master_index():
+    """거래처/품명/규격 선택 목록과 (매입처, 품명, 규격) 조회 색인 - 자재마스터가 다시 로딩될 때만 재생성"""
+    return sheet_cache.derive(MAT_SHEET, "master", lambda: read_sheet(MAT_SHEET), MasterIndex)
+
+def load_quote_pricer():
+    """견적 단가 조회기 (사양별 단가표 메모이즈) - 자재마스터가 다시 로딩될 때만 재생성"""
+    def _build(df_mat):
+        indexed_mat, app_index = load_applicability_index()
+        # 그 사이 자재마스터가 다시 로딩됐으면 이 버전으로 역색인을 새로 만듦
+        if indexed_mat is not df_mat:
+            app_index = ApplicabilityIndex(df_mat['적용설비'].tolist() if '적용설비' in df_mat.columns else [])
+        return QuotePricer(df_mat, app_index)
+    return sheet_cache.derive(MAT_SHEET, "pricing", lambda: read_sheet(MAT_SHEET), _build)
+
+# 추가(append) 쓰기는 지연 반영 큐로 -> 클릭 즉시 응답, 반영 완료 시 해당 시트 캐시 무효화
+WRITE_QUEUE_PATH = os.environ.get("WRITE_QUEUE_PATH", "write_queue.db")
+
+@st.cache_resource
+def get_write_queue(path):
+    def _on_flush(names):
+        # 자기 쓰기는 변경 감지에서 제외 (추가된 행은 다음 조회 때 증분으로 읽음)
+        change_detector.mark_written(storage, *names)
+        sheet_cache.invalidate(*names)
+    return WriteBehindQueue(storage, path, on_flush=_on_flush).start()
+
+write_queue = get_write_queue(WRITE_QUEUE_PATH)
+
+@st.cache_resource
+def get_code_allocator():
+    return CodeAllocator()
+
+code_allocator = get_code_allocator()
+
+# 재고이력 -> 재고스냅샷 압축 주기 (초, 0 이면 압축 안 함)
+STOCK_COMPACT_SECONDS = int(os.environ.get("STOCK_COMPACT_SECONDS", "3600"))
+
+@st.cache_resource
+def start_stock_compaction(interval):
+    if interval <= 0: return None
+    return start_periodic_compaction(storage, stock_ledger, interval,
+                                     on_done=lambda: (change_detector.mark_written(storage, SNAPSHOT_SHEET, MAT_SHEET),
+                                                      sheet_cache.invalidate(MAT_SHEET)))
+
+start_stock_compaction(STOCK_COMPACT_SECONDS)
 
 # -----------------------------------------------------
-# 5. 적용설비 매칭 로직 (NEW)
+# 3-3. 백그라운드 예열 (첫 화면 / 첫 발주서가 기다리지 않도록)
 # -----------------------------------------------------
+@st.cache_resource
+def start_warmup():
+    """서버 프로세스당 1회: 자재마스터 / 적용설비 역색인 / 발주 대기 목록 / 재고 / 견적 색인 / 한글 폰트를 미리 준비"""
+    def _run():
+        for job in (load_applicability_index, load_pending_orders, load_stock, load_quote_index, ensure_font_exists):
+            try: job()
+            except Exception: pass  # 예열 실패는 무시 (실제 조회 시 다시 시도)
+    thread = threading.Thread(target=_run, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+start_warmup()
+
 # -----------------------------------------------------
-# 5. 적용설비 매칭 로직 (수정된 버전)
+# 3-4. 대용량 표 (서버 필터 + 페이지 단위 편집)
 # -----------------------------------------------------
-def check_applicability(tag_string, selection):
+PAGE_SIZE = 50
+
+def paged_editor(frame, key, editable, version=0, page_size=PAGE_SIZE, **editor_kwargs):
     """
-    tag_string: 시트의 '적용설비' 값 (예: '탑밀30L-철@, 횡형밀@')
-    selection: 사용자가 선택한 값 딕셔너리
+    frame: 서버에서 이미 필터링한 결과 (인덱스 = 행 키, 예: 시트 행번호)
+    현재 페이지만 data_editor 로 보내고, editable 열의 편집 내용은 세션에 {행 키: {열: 값}} 로만 보관
+    -> 페이지 / 필터를 바꿔도 체크 / 수량이 행 키로 유지됨
+    version: 원본 데이터가 바뀌면 달라지는 값 (편집기 상태가 다른 행에 적용되지 않도록)
     """
-    if not tag_string or str(tag_string).strip() == "": return False
-    
-    # 태그를 쉼표로 분리 (공백 제거 포함)
-    tags = [t.strip() for t in str(tag_string).split(',')]
-    
-    sel_equip = selection['equip']   # 예: 탑밀
-    raw_capa = str(selection['capa']) # 예: 30 (숫자일 수 있음)
-    
-    # [핵심 수정 1] 숫자만 있는 용량(30) 뒤에 강제로 'L'을 붙여서 비교
-    # 30 -> 30L, 1~4L -> 1~4L (그대로)
-    if raw_capa.isdigit():
-        sel_capa = raw_capa + "L"
+    edits = st.session_state.setdefault(f"{key}_edits", {})
+    n_pages = max(1, -(-len(frame) // page_size))
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > n_pages: st.session_state[page_key] = 1
+    if n_pages > 1:
+        page = st.number_input(f"페이지 (전체 {n_pages}쪽, {len(frame)}건)", min_value=1, max_value=n_pages, step=1, key=page_key)
     else:
-        sel_capa = raw_capa
+        page = 1
+    view = apply_edits(frame.iloc[(page - 1) * page_size:page * page_size], edits, editable)
+    edited = st.data_editor(view, key=f"{key}_editor_{version}_{page}", **editor_kwargs)
 
-    sel_explo_raw = selection['explo'] # 예: 안전증방폭(eG3)
-    sel_mat_raw = selection['mat']     # 예: SUS304 (스텐)
-    
-    # [핵심 수정 2] 매칭 키워드 확장 (유연성 확보)
-    # 사용자가 '안전증방폭(eG3)'을 선택했다면 -> ['방폭', 'eG3', 'EG3', '안전증'] 키워드를 모두 가짐
-    current_options = []
-    
-    # 1. 방폭 관련 키워드 생성
-    if "비방폭" in sel_explo_raw:
-        current_options.append("비방폭")
-    else:
-        current_options.append("방폭") # 기본적으로 방폭임
-        if "eG3" in sel_explo_raw or "EG3" in sel_explo_raw:
-            current_options.extend(["eG3", "EG3", "안전증"])
-        if "d2G4" in sel_explo_raw:
-            current_options.extend(["d2G4", "내압"])
-
-    # 2. 재질 관련 키워드 생성
-    if "SUS" in sel_mat_raw or "스텐" in sel_mat_raw:
-        current_options.extend(["스텐", "SUS", "써스"])
-    else:
-        current_options.extend(["철", "SS400", "일반"])
-
-    # --- 태그 검사 시작 ---
-    for tag in tags:
-        # 태그가 비어있으면 패스
-        if not tag: continue
-
-        # 1. '횡형밀' 특수 그룹 체크
-        if "횡형밀" in tag:
-            if sel_equip in ["베스트밀", "퍼펙트밀", "탑밀"]: 
-                # 횡형밀이라도 뒤에 옵션(예: 횡형밀@-스텐@)이 붙을 수 있으므로 아래 로직을 태움
-                pass 
-            else:
-                continue # 횡형밀이 아니면 다음 태그로
+    # 편집 결과를 행 키 기준으로 보관 (원본과 같아진 값은 삭제)
+    base = frame.loc[view.index, editable]
+    for row_key, (orig, new) in zip(view.index, zip(base.to_dict('records'), edited[editable].to_dict('records'))):
+        changed = {c: v for c, v in new.items() if v != orig[c] and not (pd.isna(v) and pd.isna(orig[c]))}
+        if changed: edits[row_key] = changed
+        else: edits.pop(row_key, None)
+    return edits
 
-        # 태그 분해 (예: 탑밀30L-철@ -> ['탑밀30L', '철@'])
-        tokens = [t.strip().replace("@", "") for t in tag.split('-')]
-        head = tokens[0] # 설비명 부분
-        
-        # 2. 설비명 및 용량 일치 여부 확인
-        is_equip_match = False
-        
-        # Case A: '횡형밀' 같은 그룹명인 경우 (이미 위에서 필터링 했으므로 통과)
-        if "횡형밀" in head:
-            is_equip_match = True
-            
-        # Case B: '탑밀' 처럼 용량 없이 설비명만 있는 경우 (@가 붙어있거나 텍스트만 일치)
-        elif head == sel_equip:
-            is_equip_match = True
-            
-        # Case C: '탑밀30L' 처럼 용량까지 지정된 경우
-        # 아까 만든 sel_capa ("30L")와 결합해서 비교
-        elif head == f"{sel_equip}{sel_capa}":
-            is_equip_match = True
-            
-        # 설비 조건이 안 맞으면 이 태그는 탈락
-        if not is_equip_match:
-            continue
+def apply_edits(frame, edits, editable):
+    """세션 편집 내용 {행 키: {열: 값}} 을 덮어쓴 사본 (편집된 행만 바뀜)"""
+    keys = [k for k in frame.index if k in edits]
+    if not keys: return frame
+    frame = frame.copy()
+    for k in keys:
+        for col, val in edits[k].items():
+            if col in editable: frame.at[k, col] = val
+    return frame
 
-        # 3. 옵션(재질/방폭) 상세 일치 여부 확인
-        # tokens[1:] 부터는 '철', '방폭', 'EG3' 같은 조건들임
-        # 이 조건들이 위에서 만든 current_options 리스트에 다 들어있어야 함
-        
-        is_option_match = True
-        if len(tokens) > 1:
-            for req in tokens[1:]:
-                # 태그에 적힌 조건(req)이 현재 내 상황(current_options)에 없으면 탈락
-                # 대소문자 무시를 위해 upper() 사용 추천하지만, 일단 단순 비교
-                match_found = False
-                for my_opt in current_options:
-                    if req.upper() == my_opt.upper():
-                        match_found = True
-                        break
-                
-                if not match_found:
-                    is_option_match = False
-                    break
-        
-        if is_option_match:
-            return True # 하나라도 조건에 맞는 태그를 찾으면 즉시 성공!
-            
-    return False
+# -----------------------------------------------------
+# 3-5. 시트 직접 수정 감지 (사이드바 + 각 화면 조각 재실행마다, 폴링 주기마다 1회)
+# -----------------------------------------------------
+def check_remote_changes():
+    """바뀐 시트만 캐시 무효화 + 증분 상태 초기화. return: 바뀐 시트 목록"""
+    changed_sheets = change_detector.poll(storage, sheet_cache)
+    # 발주내역이 시트에서 직접 수정됐으면 (중간 행 수정/삭제 가능) 증분 대신 전체 재로딩
+    if ORD_SHEET in changed_sheets:
+        order_log.reset()
+        analytics.reset(ORD_SHEET)
+    if QUOTE_SHEET in changed_sheets:
+        quote_index.reset()
+        analytics.reset(QUOTE_SHEET)
+    # 다른 곳에서 스냅샷을 새로 만들었거나 자재마스터(스냅샷에 없는 자재의 시작 재고)가 바뀌었으면 기준값부터 다시 읽음
+    if SNAPSHOT_SHEET in changed_sheets or MAT_SHEET in changed_sheets:
+        stock_ledger.reset()
+        sheet_cache.invalidate(LEDGER_SHEET)
+    return changed_sheets
+
+def notify_remote_changes():
+    # 화면 조각(fragment)만 재실행될 때도 폴링 (사이드바는 전체 재실행 때만 그려짐)
+    changed_sheets = check_remote_changes()
+    if changed_sheets: st.toast(f"🔄 시트 변경 반영: {', '.join(changed_sheets)}")
 
 # -----------------------------------------------------
-# 6. 화면 UI 메인
+# 7. 화면 UI 메인
 # -----------------------------------------------------
 st.title("🏭 베스트 화학 통합 ERP")
-tab1, tab2, tab3 = st.tabs(["📑 견적 관리(영업)", "📦 자재 발주(구매)", "✅ 입고 확인(창고)"])
+
+# 시트에서 직접 수정된 내용 확인 (폴링 주기마다 1회, 바뀐 시트만 다시 로딩)
+with st.sidebar:
+    if st.button("🔄 시트 새로고침"):
+        order_log.reset()
+        stock_ledger.reset()
+        quote_index.reset()
+        analytics.reset()
+        sheet_cache.invalidate(*SHEET_NAMES)
+    changed_sheets = check_remote_changes()
+    if changed_sheets: st.caption(f"변경 감지: {', '.join(changed_sheets)}")
+    # 자재마스터 열 구성 확인 (로딩 시 1회 타입 변환, 없는 열은 변환에서 제외됨)
+    missing_mat_cols = missing_columns(MAT_SHEET, load_materials())
+    if missing_mat_cols: st.warning(f"자재마스터에 없는 열: {', '.join(missing_mat_cols)}")
+
+    # 쓰기 큐 상태
+    q_status = write_queue.status()
+    last_flush = datetime.fromtimestamp(q_status['last_flush']).strftime("%H:%M:%S") if q_status['last_flush'] else "-"
+    st.caption(f"📤 시트 반영 대기: {q_status['depth']}건 · 마지막 반영: {last_flush}")
+    if q_status['last_error']:
+        st.warning(f"시트 반영 재시도 중 ({q_status['failures']}회): {q_status['last_error']}")
+    if q_status['dead']:
+        st.error(f"시트에 반영할 수 없어 보류된 요청 {q_status['dead']}건 (쓰기 큐 파일의 dead 테이블 확인)")
+
+    # 구글 API 할당량 / 호출별 지연시간
+    if STORAGE_BACKEND != "sqlite":
+        call_stats, headroom = client.quota_manager.report()
+        with st.expander(f"📊 API 여유: 읽기 {headroom['read']} · 쓰기 {headroom['write']} (분당)"):
+            if call_stats: st.dataframe(pd.DataFrame(call_stats), hide_index=True)
+# 화면별 함수는 선택된 화면만 실행 (st.tabs 는 모든 탭 본문을 매번 실행함)
+# 각 화면은 fragment 라서 화면 안의 입력/클릭은 해당 화면만 다시 실행됨
 
 # [탭 1] 견적 시스템
-# [탭 1] 견적 시스템
-with tab1:
+@st.fragment
+def render_quote_view():
     st.header("📑 견적 관리 및 산출")
+    notify_remote_changes()
     st.subheader("1. 견적 상세 조건 입력")
     
     col_input1, col_input2 = st.columns(2)
@@ -287,15 +383,6 @@ with tab1:
         # 설비 종류 선택
         equip_type = st.selectbox("설비 종류", ["베스트밀", "퍼펙트밀", "탑밀", "바스켓밀", "믹서", "진공탈포기", "충진기"])
         
-        # 용량 매핑 데이터
-        CAPACITY_MAP = {
-            "베스트밀": [5, 10, 30, 40, 50],
-            "퍼펙트밀": [5, 10, 30, 40, 50],
-            "탑밀": [20, 30, 40, 50],
-            "바스켓밀": ["1~4L", "20~40L", "100L", "200L", "300L", "500L", "1000L", "3000L", "5000L"],
-            "충진기": ["1구", "2구"]
-        }
-        
         capacity = None
         if equip_type in ["믹서", "진공탈포기"]:
             st.info("💡 믹서/탈포기는 메인 모터 기준")
@@ -325,6 +412,18 @@ with tab1:
         material_radio = st.radio("접액부 재질", ["일반 철 (SS400)", "스테인리스 (SUS304)"])
     with c_opt3:
         options = st.text_area("기타 옵션 (특이사항)")
+
+    # 같은 사양(설비/용량/방폭/재질)의 과거 견적 중 모터 마력이 가까운 순 (색인 조회, 시트 재조회 없음)
+    spec = {"설비": equip_type, "용량": str(capacity) if capacity else "-", "메인": main_hp, "서브": sub_hp,
+            "방폭": explosion_type, "재질": material_radio}
+    similar = load_quote_index().similar(spec)
+    with st.expander(f"🔎 유사 과거 견적 ({len(similar)}건)", expanded=bool(similar)):
+        if similar:
+            st.dataframe(pd.DataFrame(similar)[["견적ID", "날짜", "메인", "서브", "옵션", "총액", "마력차"]],
+                         column_config={"총액": st.column_config.NumberColumn("총액 (원)", format="%d")},
+                         use_container_width=True, hide_index=True)
+        else:
+            st.caption("같은 사양으로 저장된 견적이 없습니다.")
     
     # ----------------------------------------------------------------
     # [가견적 산출 버튼 로직]
@@ -337,27 +436,16 @@ with tab1:
         st.session_state['quote_data'] = {
             "견적ID": quote_id,
             "날짜": now.strftime("%Y-%m-%d"),
-            "설비": equip_type,
-            "용량": str(capacity) if capacity else "-",
-            "메인": main_hp,
-            "서브": sub_hp,
-            "방폭": explosion_type,
-            "재질": material_radio,
+            **spec,
             "옵션": options
         }
         
         # 2. 기초 BOM(상세내역) 데이터프레임 생성
-        # 실제 단가는 0으로 두고, 아래 에디터에서 사장님이 직접 입력하게 함
-        initial_bom = [
-            {"항목": "Main Motor", "규격": main_hp, "단가": 0, "수량": 1, "비고": "자동선택"},
-            {"항목": "Sub Motor", "규격": sub_hp, "단가": 0, "수량": 1, "비고": "자동선택"},
-            {"항목": "Body Vessel (가공/제관)", "규격": f"{capacity} ({material_radio})", "단가": 0, "수량": 1, "비고": "본체 및 프레임"},
-            {"항목": "Control Panel (전장)", "규격": explosion_type, "단가": 0, "수량": 1, "비고": "인버터 포함"},
-            {"항목": "기타 자재 (배관/볼트)", "규격": "-", "단가": 0, "수량": 1, "비고": "소모 자재 일체"},
-            {"항목": "노무비 및 경비", "규격": "-", "단가": 0, "수량": 1, "비고": "조립/시운전"},
-            {"항목": "이윤 및 기업관리비", "규격": "-", "단가": 0, "수량": 1, "비고": ""}
-        ]
-        st.session_state['quote_detail_df'] = pd.DataFrame(initial_bom)
+        # 모터/본체/전장반 단가는 자재마스터에서 자동 조회, 나머지는 아래 에디터에서 직접 입력
+        q = st.session_state['quote_data']
+        prices = load_quote_pricer().price(q)
+        initial_bom = build_quote_bom(q, prices, load_quote_index().latest(q))
+        st.session_state['quote_bom'] = initial_bom  # 행 dict 목록만 보관 (표는 화면 그릴 때 생성)
 
     # ----------------------------------------------------------------
     # [결과 표시 및 수정 화면]
@@ -381,10 +469,10 @@ with tab1:
         with col_res2:
             st.write("👇 **아래 표에서 '단가'와 '수량'을 수정하세요.**")
             
-            if 'quote_detail_df' in st.session_state:
+            if 'quote_bom' in st.session_state:
                 # 데이터 에디터 출력
                 edited_df = st.data_editor(
-                    st.session_state['quote_detail_df'],
+                    pd.DataFrame(st.session_state['quote_bom']),
                     num_rows="dynamic", # 행 추가/삭제 가능
                     column_config={
                         "단가": st.column_config.NumberColumn("단가 (원)", format="%d"),
@@ -417,32 +505,55 @@ with tab1:
                     
                     # 2. 구글 시트(견적DB)에 추가
                     try:
-                        ws_quote.append_row(row_data)
-                        st.success("✅ 견적 내역이 성공적으로 저장되었습니다!")
+                        write_queue.append_rows(QUOTE_SHEET, [row_data])
+                        st.success("✅ 견적 내역이 저장되었습니다! (시트에는 백그라운드로 반영)")
                         st.balloons() # 축하 효과
                         
                         # (선택사항) 저장 후 초기화 하고 싶으면 아래 주석 해제
                         # del st.session_state['quote_data']
-                        # del st.session_state['quote_detail_df']
+                        # del st.session_state['quote_bom']
                         # st.rerun()
                         
                     except Exception as e:
                         st.error(f"저장 중 오류 발생: {e}")
                         
+MODE_A_COLUMNS = ['선택', '매입처', '품명', '규격', '단가', '주문수량', '비고', '자재코드']
+
+def mode_a_frame(rows):
+    """세션의 {'keys': 시트 행번호 목록, 'note': 비고} -> 공유 자재마스터에서 만든 편집용 표 (세션에 저장하지 않음)"""
+    df_mat = load_materials()
+    matched = df_mat.loc[[k for k in rows['keys'] if k in df_mat.index]]
+    # 범주형 열은 편집 표에서 선택 상자로 바뀌지 않도록 일반 텍스트로
+    matched = matched.astype({c: str for c in CATEGORY_COLUMNS[MAT_SHEET] if c in matched.columns})
+    return matched.assign(선택=True, 주문수량=1, 비고=rows['note'])[MODE_A_COLUMNS]
+
+MRP_COLUMNS = ["자재코드", "매입처", "품명", "규격", "소요량", "현재재고", "발주잔량", "순소요량"]
+
+def mrp_frame(rows):
+    """세션의 [(자재코드, 소요량, 현재재고, 발주잔량), ...] -> 공유 자재마스터로 이름을 붙인 결과 표"""
+    codes = load_code_rows()
+    frame = pd.DataFrame(
+        [(code, *codes.get(code, ("", "", "")), need, stock, open_qty) for code, need, stock, open_qty in rows],
+        columns=MRP_COLUMNS[:-1])
+    frame["순소요량"] = (frame["소요량"] - frame["현재재고"] - frame["발주잔량"]).clip(lower=0)
+    return frame
+
 # [탭 2] 자재 발주 (대폭 수정됨)
-with tab2:
+@st.fragment
+def render_order_view():
     st.header("📦 자재 발주 시스템")
+    notify_remote_changes()
     
-    # DB 로딩
-    data_mat = ws_mat.get_all_records()
-    df_mat = pd.DataFrame(data_mat)
+    # DB 로딩 (공용 캐시, 재실행 시 API 호출 없음)
+    df_mat = load_materials()
     
     # 발주 모드 선택
-    order_mode = st.radio("발주 방식 선택", ["🔵 규격 설비 일괄 발주", "🟠 부품 및 비규격 개별 발주"], horizontal=True)
+    order_mode = st.radio("발주 방식 선택", ["🔵 규격 설비 일괄 발주", "🟣 생산계획 일괄 발주 (MRP)", "🟠 부품 및 비규격 개별 발주"], horizontal=True)
     st.divider()
 
     # 장바구니 초기화
-    if 'cart' not in st.session_state: st.session_state['cart'] = []
+    if 'cart' not in st.session_state: st.session_state['cart'] = Cart()
+    cart = st.session_state['cart']
 
     # -----------------------------------------------
     # MODE A: 규격 설비 일괄 발주
@@ -471,28 +582,32 @@ with tab2:
                     "mat": sel_mat
                 }
                 
-                # 필터링 로직 적용
-                df_mat['is_match'] = df_mat['적용설비'].apply(lambda x: check_applicability(x, selection))
-                matched_df = df_mat[df_mat['is_match'] == True].copy()
+                # 필터링 로직 적용 (역색인 조회, 행 단위 태그 분해 없음)
+                indexed_mat, app_index = load_applicability_index()
+                matched_df = indexed_mat.iloc[app_index.match(selection)]
                 
                 if matched_df.empty:
                     st.warning("조건에 맞는 자재가 없습니다. '적용설비' 컬럼을 확인해주세요.")
                 else:
                     st.success(f"총 {len(matched_df)}개의 자재가 검색되었습니다.")
                     
-                    # 데이터 에디터용 가공
-                    matched_df['선택'] = True
-                    matched_df['주문수량'] = 1
-                    matched_df['비고'] = f"{sel_eq}{sel_cap}용"
-                    
-                    show_cols = ['선택', '매입처', '품명', '규격', '단가', '주문수량', '비고', '자재코드']
-                    
-                    st.session_state['editor_data'] = matched_df[show_cols]
+                    # 세션에는 매칭된 행 키(시트 행번호)와 비고만 보관, 표는 공유 자재마스터에서 매번 다시 만듦
+                    st.session_state['mode_a_rows'] = {
+                        'keys': matched_df.index.tolist(), 'note': f"{sel_eq}{sel_cap}용",
+                        'id': st.session_state.get('mode_a_rows', {}).get('id', 0) + 1,
+                    }
+                    st.session_state['mode_a_edits'] = {}
 
         # 불러온 데이터 표시 및 장바구니 담기
-        if 'editor_data' in st.session_state:
-            edited_df = st.data_editor(
-                st.session_state['editor_data'],
+        if 'mode_a_rows' in st.session_state:
+            rows = st.session_state['mode_a_rows']
+            editor_data = mode_a_frame(rows)
+            f1, f2 = st.columns(2)
+            with f1: f_sup = st.multiselect("매입처", sorted(editor_data['매입처'].unique()), key="mode_a_f_sup")
+            with f2: f_text = st.text_input("검색 (품명/규격/자재코드)", key="mode_a_f_text")
+            shown = filter_frame(editor_data, isin={'매입처': f_sup}, text=f_text, text_cols=('품명', '규격', '자재코드'))
+            edits = paged_editor(
+                shown, "mode_a", list(editor_data.columns), version=f"{rows['id']}_{sheet_cache.version(MAT_SHEET)}",
                 column_config={
                     "선택": st.column_config.CheckboxColumn("발주", default=True),
                     "주문수량": st.column_config.NumberColumn("수량", min_value=1, step=1)
@@ -502,23 +617,65 @@ with tab2:
             )
             
             if st.button("🛒 선택한 항목 장바구니에 담기"):
+                edited_df = apply_edits(editor_data, edits, list(editor_data.columns))
                 selected_rows = edited_df[edited_df['선택'] == True]
-                count = 0
-                for _, row in selected_rows.iterrows():
-                    st.session_state['cart'].append({
-                        'code': row['자재코드'],
-                        'name': row['품명'],
-                        'spec': row['규격'],
-                        'qty': row['주문수량'],
-                        'supplier': row['매입처'],
-                        'note': row['비고'],
-                        'is_new': False
-                    })
-                    count += 1
-                st.success(f"{count}개 품목을 장바구니에 담았습니다! 아래에서 발주서를 생성하세요.")
-                del st.session_state['editor_data'] # 초기화
+                cart.add([
+                    {'code': r['자재코드'], 'name': r['품명'], 'spec': r['규격'], 'qty': r['주문수량'],
+                     'supplier': r['매입처'], 'note': r['비고'], 'is_new': False}
+                    for r in selected_rows.to_dict('records')
+                ])
+                st.success(f"{len(selected_rows)}개 품목을 장바구니에 담았습니다! 아래에서 발주서를 생성하세요.")
+                # 초기화
+                del st.session_state['mode_a_rows']
+                st.session_state['mode_a_edits'] = {}
                 st.rerun()
 
+    # -----------------------------------------------
+    # MODE C: 생산계획 -> 재고/발주잔량 차감 후 순소요량 일괄 발주
+    # -----------------------------------------------
+    elif "생산계획" in order_mode:
+        st.info("💡 생산할 설비 사양과 대수를 입력하면, 현재재고와 입고 대기 발주를 뺀 부족분만 장바구니에 담습니다.")
+        if 'mrp_plan' not in st.session_state:
+            st.session_state['mrp_plan'] = pd.DataFrame(
+                [{"설비": "탑밀", "용량": "30", "방폭": "비방폭", "재질": "SS400 (철)", "대수": 1}], columns=PLAN_COLUMNS)
+        plan_df = st.data_editor(
+            st.session_state['mrp_plan'],
+            column_config={
+                "설비": st.column_config.SelectboxColumn("설비", options=["베스트밀", "퍼펙트밀", "탑밀", "바스켓밀"], required=True),
+                "용량": st.column_config.TextColumn("용량", help="예: 30, 1~4L"),
+                "방폭": st.column_config.SelectboxColumn("방폭", options=["비방폭", "내압방폭(d2G4)", "안전증방폭(eG3)"], required=True),
+                "재질": st.column_config.SelectboxColumn("재질", options=["SS400 (철)", "SUS304 (스텐)"], required=True),
+                "대수": st.column_config.NumberColumn("대수", min_value=1, step=1, required=True),
+            },
+            num_rows="dynamic", use_container_width=True, hide_index=True, key="mrp_editor"
+        )
+
+        if st.button("🧮 소요량 계산", type="primary"):
+            if "적용설비" not in df_mat.columns:
+                st.error("자재마스터 시트에 '적용설비' 컬럼이 없습니다!")
+            else:
+                st.session_state['mrp_plan'] = plan_df
+                indexed_mat, app_index = load_applicability_index()
+                result = explode_plan(indexed_mat, app_index, plan_df.to_dict('records'), load_pending_orders(), stock_map())
+                # 세션에는 자재코드와 수량만 (품명 등은 공유 자재마스터에서 다시 붙임)
+                st.session_state['mrp_result'] = [
+                    (str(code), int(need), int(stock), int(open_qty))
+                    for code, need, stock, open_qty in result[["자재코드", "소요량", "현재재고", "발주잔량"]].itertuples(index=False)
+                ]
+
+        if 'mrp_result' in st.session_state:
+            result = mrp_frame(st.session_state['mrp_result'])
+            if result.empty:
+                st.warning("조건에 맞는 자재가 없습니다. '적용설비' 컬럼을 확인해주세요.")
+            else:
+                short = result[result['순소요량'] > 0]
+                st.success(f"자재 {len(result)}종 중 {len(short)}종 부족 ({short['매입처'].nunique()}개 거래처)")
+                st.dataframe(result, hide_index=True, use_container_width=True)
+                if not short.empty and st.button("🛒 부족분 장바구니에 담기"):
+                    cart.add(plan_to_cart(result, f"생산계획 {sum(to_int(v) for v in plan_df['대수'])}대"))
+                    del st.session_state['mrp_result']
+                    st.rerun()
+
     # -----------------------------------------------
     # MODE B: 부품 및 비규격 개별 발주 (기존 로직)
     # -----------------------------------------------
@@ -527,17 +684,15 @@ with tab2:
         col1, col2 = st.columns([1, 1])
 
         with col1:
-            suppliers_raw = list(set([str(d.get('매입처', '')).strip() for d in data_mat if str(d.get('매입처', '')).strip()]))
-            suppliers = sorted(suppliers_raw)
-            suppliers.insert(0, "➕ 신규 거래처 입력")
+            master = load_master_index()
+            suppliers = ["➕ 신규 거래처 입력"] + master.suppliers
             
             sel_supplier = st.selectbox("거래처", suppliers)
             final_supplier = st.text_input("거래처명 직접 입력") if sel_supplier == "➕ 신규 거래처 입력" else sel_supplier
 
             items_options = []
             if sel_supplier != "➕ 신규 거래처 입력":
-                items_raw = list(set([str(d.get('품명', '')) for d in data_mat if str(d.get('매입처', '')).strip() == final_supplier]))
-                items_options = sorted(items_raw)
+                items_options = list(master.items(final_supplier))
             
             items_options.insert(0, "➕ 신규 품명 입력")
             sel_item = st.selectbox("품명", items_options)
@@ -545,24 +700,15 @@ with tab2:
 
             specs_options = []
             if sel_item != "➕ 신규 품명 입력":
-                specs_raw = list(set([str(d.get('규격', '')) for d in data_mat if str(d.get('품명', '')) == final_item]))
-                specs_options = sorted(specs_raw)
+                specs_options = list(master.specs(final_supplier, final_item))
             
             specs_options.insert(0, "➕ 신규 규격 입력")
             sel_spec = st.selectbox("규격", specs_options)
             final_spec = st.text_input("규격 직접 입력") if sel_spec == "➕ 신규 규격 입력" else sel_spec
             
-            # 단가 및 수량
-            est_price = 0
-            if sel_item != "➕ 신규 품명 입력" and sel_spec != "➕ 신규 규격 입력":
-                try:
-                    match = df_mat[
-                        (df_mat['품명'].astype(str) == final_item) & 
-                        (df_mat['규격'].astype(str) == final_spec)
-                    ]
-                    if not match.empty:
-                        est_price = int(str(match.iloc[0]['단가']).replace(',',''))
-                except: est_price = 0
+            # 단가 및 수량 (색인 조회, 열 전체 비교 없음)
+            known = master.lookup(final_supplier, final_item, final_spec)
+            est_price = known['단가'] if known and sel_item != "➕ 신규 품명 입력" and sel_spec != "➕ 신규 규격 입력" else 0
             
             price = st.number_input("단가 (원)", value=est_price, step=100)
             qty = st.number_input("발주 수량", min_value=1, value=10)
@@ -572,111 +718,171 @@ with tab2:
                 if not final_supplier or not final_item:
                     st.error("거래처와 품명은 필수입니다.")
                 else:
-                    is_new = True
-                    mat_code = ""
-                    
-                    try:
-                        match = df_mat[
-                            (df_mat['매입처'].astype(str) == final_supplier) & 
-                            (df_mat['품명'].astype(str) == final_item) & 
-                            (df_mat['규격'].astype(str) == final_spec)
-                        ]
-                    except: match = pd.DataFrame()
-
-                    if not match.empty:
+                    if known:
                         is_new = False
-                        mat_code = match.iloc[0]['자재코드']
+                        mat_code = known['자재코드']
                     else:
                         is_new = True
                         base_code = generate_smart_code(final_supplier, final_item, final_spec)
-                        mat_code = f"{base_code}-{datetime.now().strftime('%M%S')}" 
+                        mat_code = code_allocator.allocate([base_code], df_mat['자재코드'])[0]
                         # 신규 등록은 일단 장바구니에서 처리하거나 여기서 바로 시트에 추가
                         new_mat_row = [mat_code, final_item, final_spec, "", price, final_supplier, 0, ""]
-                        ws_mat.append_row(new_mat_row)
+                        write_queue.append_rows(MAT_SHEET, [new_mat_row])
                         st.toast(f"✨ 자재마스터 등록 완료: {final_item}")
                     
-                    st.session_state['cart'].append({
+                    cart.add([{
                         'code': mat_code, 'name': final_item, 'spec': final_spec,
                         'qty': qty, 'supplier': final_supplier, 'note': note, 'is_new': is_new
-                    })
+                    }])
                     st.success("담기 완료")
 
+        # 자재마스터 일괄 등록 (CSV / 엑셀)
+        with st.expander("📥 자재마스터 일괄 등록 (CSV / 엑셀)"):
+            st.caption("열: 매입처, 품명 (필수) / 규격, 적용설비, 단가, 현재재고, 비고, 자재코드 (선택) · 자재코드가 비어 있으면 자동 발급")
+            upload = st.file_uploader("파일 선택", type=["csv", "xlsx"], key="mat_import_file")
+            if upload is not None and st.button("📥 일괄 등록", key="mat_import_btn"):
+                try:
+                    if upload.name.lower().endswith(".xlsx"): df_in = pd.read_excel(upload, dtype=str)
+                    else: df_in = pd.read_csv(upload, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+                    new_rows, skipped = plan_material_import(df_in, df_mat, code_allocator, write_queue.pending_rows(MAT_SHEET))
+                except ImportError:
+                    st.error("엑셀 파일을 읽으려면 openpyxl 이 필요합니다. CSV 로 저장해서 올려주세요.")
+                except Exception as e:
+                    st.error(f"파일 처리 실패: {e}")
+                else:
+                    # 한 번의 일괄 추가로 반영
+                    write_queue.append_rows(MAT_SHEET, new_rows)
+                    write_queue.append_rows(LEDGER_SHEET, opening_movements(new_rows))
+                    st.success(f"✨ {len(new_rows)}건 등록 요청 완료 (제외 {len(skipped)}건)")
+                    if not skipped.empty: st.dataframe(skipped, hide_index=True, use_container_width=True)
+
     # -----------------------------------------------
     # 공통: 장바구니 및 발주 확정 영역
     # -----------------------------------------------
     st.divider()
     st.subheader("🛒 발주 대기 목록 (장바구니)")
+
+    # 발주 목록 CSV 일괄 가져오기 (자재마스터와 한 번에 매칭)
+    with st.expander("📤 발주 목록 CSV 가져오기"):
+        st.caption("열: 자재코드 또는 품명+규격 (매입처 선택), 수량, 비고")
+        cart_file = st.file_uploader("파일 선택", type=["csv"], key="cart_import_file")
+        if cart_file is not None and st.button("🛒 장바구니에 일괄 담기", key="cart_import_btn"):
+            try:
+                items, unmatched = match_cart_lines(pd.read_csv(cart_file, dtype=str, keep_default_na=False, encoding="utf-8-sig"), df_mat)
+            except Exception as e:
+                st.error(f"파일 처리 실패: {e}")
+            else:
+                cart.add(items)
+                st.success(f"{len(items)}개 품목을 장바구니에 담았습니다.")
+                if not unmatched.empty:
+                    st.warning(f"자재마스터에서 찾지 못했거나 수량이 0인 행 {len(unmatched)}건")
+                    st.dataframe(unmatched, hide_index=True, use_container_width=True)
+
+    # 발주점 이하 자재 -> 거래처별 보충 발주 (가용재고 = 재고 + 입고 대기)
+    low_stock = load_low_stock()
+    with st.expander(f"🔔 재고 부족 자재 (발주점 이하 {len(low_stock)}건)", expanded=not low_stock.empty):
+        if low_stock.empty: st.caption("발주점 이하인 자재가 없습니다.")
+        else:
+            st.dataframe(low_stock, hide_index=True, use_container_width=True)
+            low_suppliers = sorted(low_stock['매입처'].unique())
+            sel_suppliers = st.multiselect("보충할 거래처", low_suppliers, default=low_suppliers, key="reorder_suppliers")
+            if st.button("🛒 부족분 장바구니에 담기", key="reorder_to_cart"):
+                items = reorder_to_cart(low_stock[low_stock['매입처'].isin(sel_suppliers)])
+                cart.add(items)
+                st.success(f"{len(items)}개 품목을 장바구니에 담았습니다.")
+
+        st.caption("발주점 설정 (발주량 0 = 발주점 x 2 까지 보충, 발주점 0 = 관리 해제)")
+        c1, c2, c3, c4 = st.columns([2, 1, 1, 1])
+        with c1: rop_code = st.text_input("자재코드", key="rop_code").strip()
+        with c2: rop_point = st.number_input("발주점", min_value=0, step=1, key="rop_point")
+        with c3: rop_lot = st.number_input("발주량", min_value=0, step=1, key="rop_lot")
+        with c4:
+            st.write("")
+            if st.button("💾 발주점 저장", key="rop_save") and rop_code:
+                if rop_code not in load_code_rows(): st.error(f"자재마스터에 없는 자재코드: {rop_code}")
+                else:
+                    write_queue.append_rows(REORDER_SHEET, [reorder_point_row(rop_code, rop_point, rop_lot)])
+                    st.toast(f"{rop_code} 발주점 {rop_point} 저장 (반영 대기)")
+
+    # 전체 발주 확정 직후: 모든 거래처 발주서 ZIP
+    if 'last_order_zip' in st.session_state:
+        zip_name, zip_bytes = st.session_state['last_order_zip']
+        # 내려받으면 세션에서 ZIP 을 지움 (세션에 큰 바이트를 계속 들고 있지 않도록)
+        if zip_bytes: st.download_button("📥 확정된 발주서 전체 다운로드 (ZIP)", zip_bytes, file_name=zip_name, mime="application/zip",
+                                         on_click=lambda: st.session_state.pop('last_order_zip', None))
+        else:
+            st.error("발주는 확정됐지만 한글 폰트를 준비하지 못해 PDF를 만들 수 없습니다.")
+            del st.session_state['last_order_zip']
     
-    cart_df = pd.DataFrame(st.session_state['cart'])
-    
-    if not cart_df.empty:
-        st.dataframe(cart_df[['supplier', 'name', 'spec', 'qty', 'note']], hide_index=True, use_container_width=True)
+    if len(cart):
+        st.dataframe(cart.frame()[['supplier', 'name', 'spec', 'qty', 'note']], hide_index=True, use_container_width=True)
         
-        unique_suppliers = cart_df['supplier'].unique()
+        unique_suppliers = cart.suppliers()
+        
+        # 전체 거래처 발주서 한 번에 생성 (병렬 렌더링 -> ZIP 1개)
+        if len(unique_suppliers) > 1 and st.button("📦 전체 거래처 PDF 일괄 생성 (ZIP)"):
+            with st.spinner(f"{len(unique_suppliers)}개 거래처 발주서 생성 중..."):
+                zip_bytes = render_orders_zip(cart.by_supplier())
+            if zip_bytes:
+                st.download_button("📥 ZIP 다운로드", zip_bytes,
+                                   file_name=f"발주서_전체_{datetime.now().strftime('%y%m%d')}.zip",
+                                   mime="application/zip")
+            else:
+                st.error("한글 폰트를 준비하지 못해 PDF를 만들 수 없습니다.")
         
         for sup in unique_suppliers:
             st.markdown(f"**🏢 {sup}**")
-            current_cart = cart_df[cart_df['supplier'] == sup]
             
             col_act1, col_act2 = st.columns(2)
             with col_act1:
                 if st.button(f"📄 PDF 생성 ({sup})"):
-                    pdf_file = generate_order_pdf({'name': sup}, current_cart.to_dict('records'))
-                    if pdf_file:
-                        with open(pdf_file, "rb") as f:
-                            st.download_button("📥 다운로드", f, file_name=pdf_file, mime="application/pdf")
+                    with st.spinner("발주서 생성 중..."):
+                        pdf_bytes = render_order_pdf({'name': sup}, cart.items(sup))
+                    if pdf_bytes:
+                        st.download_button("📥 다운로드", pdf_bytes, file_name=order_pdf_filename(sup), mime="application/pdf")
             with col_act2:
                 if st.button(f"📠 발주 확정 ({sup})", key=f"confirm_{sup}"):
                     with st.spinner("처리 중..."):
                         now_str = datetime.now().strftime("%Y-%m-%d")
                         order_id = datetime.now().strftime("%y%m%d%H%M")
+                        write_queue.append_rows(ORD_SHEET, build_order_rows(cart.items(sup), order_id, now_str))
                         
-                        new_rows = []
-                        for _, row in current_cart.iterrows():
-                            new_rows.append([
-                                order_id, now_str, row['supplier'], 
-                                row['name'], row['qty'], "발주완료", row['note'], row['code']
-                            ])
-                        ws_ord.append_rows(new_rows)
-                        
-                        st.session_state['cart'] = [item for item in st.session_state['cart'] if item['supplier'] != sup]
-                        st.success(f"{sup} 발주 완료!")
-                        time.sleep(1)
+                        cart.remove(sup)
+                        st.toast(f"{sup} 발주 완료!")
                         st.rerun()
     
-        if st.button("🗑️ 장바구니 비우기"):
-            st.session_state['cart'] = []
-            st.rerun()
+        st.divider()
+        col_all1, col_all2 = st.columns(2)
+        with col_all1:
+            # 모든 거래처를 한 번에 확정: 발주내역 일괄 추가 1회 + 발주서 전체 병렬 생성
+            if st.button(f"✅ 전체 발주 확정 ({len(unique_suppliers)}개 거래처, {len(cart)}건)", type="primary"):
+                with st.spinner("발주 확정 및 발주서 생성 중..."):
+                    now = datetime.now()
+                    carts = cart.by_supplier()
+                    cart_items = [item for items in carts.values() for item in items]
+                    write_queue.append_rows(ORD_SHEET, build_order_rows(cart_items, now.strftime("%y%m%d%H%M"), now.strftime("%Y-%m-%d")))
+                    zip_bytes = render_orders_zip(carts)
+                st.session_state['last_order_zip'] = (f"발주서_전체_{now.strftime('%y%m%d')}.zip", zip_bytes)
+                cart.clear()
+                st.toast(f"{len(unique_suppliers)}개 거래처 {len(cart_items)}건 발주 완료!")
+                st.rerun()
+        with col_all2:
+            if st.button("🗑️ 장바구니 비우기"):
+                cart.clear()
+                st.rerun()
 
 # [탭 3] 입고 확인 (완전한 코드)
-with tab3:
+@st.fragment
+def render_receiving_view():
     st.header("✅ 자재 입고 처리 (재고 자동 반영)")
+    notify_remote_changes()
     
-    # 1. 발주 내역 불러오기
-    raw_data = ws_ord.get_all_values()
+    # 1. 입고 대기('발주완료') 목록 불러오기 (증분 로딩 + 대기 건 색인)
+    pending = load_pending_orders().copy()
     
-    if len(raw_data) < 2:
+    if not order_log.has_history():
         st.info("📭 발주 내역이 없습니다.")
     else:
-        # 헤더와 데이터 분리
-        headers = ["발주ID", "날짜", "거래처", "품명", "수량", "상태", "비고", "자재코드"]
-        
-        # 데이터 정제 (열 개수가 안 맞을 경우 보정)
-        clean_rows = []
-        for row in raw_data[1:]:
-            # 행 데이터가 헤더보다 짧으면 빈카드로 채움
-            if len(row) < 8:
-                row += [""] * (8 - len(row))
-            clean_rows.append(row[:8])
-            
-        df_ord = pd.DataFrame(clean_rows, columns=headers)
-        
-        # '상태' 컬럼 공백 제거 (오류 방지)
-        df_ord['상태'] = df_ord['상태'].astype(str).str.strip()
-        
-        # 2. '발주완료' 상태인 것만 필터링 (입고 대기 목록)
-        pending = df_ord[df_ord['상태'] == "발주완료"].copy()
-        
         if pending.empty:
             st.success("🎉 현재 대기 중인 입고 건이 없습니다. (모두 처리됨)")
         else:
@@ -687,10 +893,19 @@ with tab3:
             
             # 화면에 보여줄 컬럼 지정
             cols_to_show = ['입고확인', '발주ID', '날짜', '거래처', '품명', '수량', '비고', '자재코드']
-            
-            # 데이터 에디터 (체크박스 기능)
-            edited_df = st.data_editor(
-                pending[cols_to_show],
+
+            # 2. 서버 쪽 필터 (거래처 / 날짜 / 발주ID / 검색어) -> 현재 페이지만 브라우저로 전송
+            f1, f2, f3, f4 = st.columns(4)
+            with f1: f_sup = st.multiselect("거래처", sorted(pending['거래처'].astype(str).unique()), key="recv_f_sup")
+            with f2: f_date = st.date_input("발주일 (기간)", value=(), key="recv_f_date")
+            with f3: f_id = st.text_input("발주ID (앞자리)", key="recv_f_id")
+            with f4: f_text = st.text_input("검색 (품명/자재코드/비고)", key="recv_f_text")
+            shown = filter_frame(pending[cols_to_show], isin={'거래처': f_sup}, date_col='날짜', date_range=f_date,
+                                 prefix={'발주ID': f_id}, text=f_text, text_cols=('품명', '자재코드', '비고'))
+
+            # 데이터 에디터 (체크박스 기능, 선택은 행번호로 유지)
+            edits = paged_editor(
+                shown, "recv", ['입고확인'], version=sheet_cache.version(ORD_SHEET),
                 column_config={
                     "입고확인": st.column_config.CheckboxColumn("선택", default=False),
                     "발주ID": st.column_config.TextColumn("발주번호", disabled=True),
@@ -700,6 +915,10 @@ with tab3:
                 hide_index=True, 
                 use_container_width=True
             )
+            # 필터에 가려진 행의 선택도 포함 (입고 대기에서 빠진 행의 선택은 버림)
+            for row_key in [k for k in edits if k not in pending.index]: edits.pop(row_key)
+            edited_df = apply_edits(pending[cols_to_show], edits, ['입고확인'])
+            if edits: st.caption(f"선택: {sum(1 for e in edits.values() if e.get('입고확인'))}건")
             
             # 3. 입고 처리 버튼 로직
             if st.button("🚚 선택 항목 입고 처리 (재고 반영)", type="primary"):
@@ -712,49 +931,121 @@ with tab3:
                     progress_text = st.empty()
                     progress_text.text("데이터베이스 업데이트 중...")
                     
-                    # 자재 마스터 데이터 로딩 (재고 업데이트 위치 찾기용)
-                    mat_data = ws_mat.get_all_records()
-                    # 자재코드 : 행번호 매핑 (gspread는 1부터 시작, 헤더 제외하면 +2)
-                    mat_map = {str(r['자재코드']): i+2 for i, r in enumerate(mat_data)}
-                    
-                    success_count = 0
-                    
-                    for idx, row in to_recv.iterrows():
-                        target_id = str(row['발주ID'])
-                        mat_code = str(row['자재코드'])
-                        
-                        try:
-                            qty = int(str(row['수량']).replace(',', ''))
-                        except: 
-                            qty = 0
-                        
-                        # A. 발주 내역 시트 업데이트 ('발주완료' -> '입고완료')
-                        # 발주ID로 해당 행 찾기
-                        cell = ws_ord.find(target_id)
-                        if cell:
-                            # 6번째 열이 '상태'라고 가정
-                            ws_ord.update_cell(cell.row, 6, "입고완료")
-                        
-                        # B. 자재 마스터 시트 재고 수량 증가 (+)
-                        if mat_code in mat_map:
-                            row_num = mat_map[mat_code]
-                            # 현재 재고 가져오기 (7번째 열이 '현재재고'라고 가정)
-                            current_val = ws_mat.cell(row_num, 7).value
-                            
-                            try:
-                                current_stock = int(str(current_val).replace(',', '')) if current_val else 0
-                            except:
-                                current_stock = 0
-                                
-                            new_stock = current_stock + qty
-                            ws_mat.update_cell(row_num, 7, new_stock)
-                            
-                        success_count += 1
+                    # 행번호는 발주ID 검색 대신 인덱스로 정확히 지정 (같은 분에 만든 발주ID 중복 방지)
+                    recv_lines = [
+                        (row_num, str(row['자재코드']), int(row['수량']), str(row['발주ID']), pending.loc[row_num, ORD_HEADERS].tolist())
+                        for row_num, row in to_recv.iterrows()
+                    ]
+                    # 재고는 재고이력에 입고 행을 추가만 함 (현재값을 읽고 덮어쓰지 않음)
+                    # 다른 사용자가 먼저 처리한 행은 반영하지 않고 알려줌 (충돌 행만 자동 재시도)
+                    success_count, skipped = receive_orders(storage, recv_lines, load_materials(), sheet_cache, order_log,
+                                                               append_rows=write_queue.append_rows)
+                    change_detector.mark_written(storage, ORD_SHEET)
+                    st.session_state['recv_edits'] = {}
                     
                     progress_text.empty()
                     st.success(f"✅ 총 {success_count}건 입고 완료! 재고 수량이 증가했습니다.")
+                    if skipped:
+                        st.warning(f"⚠️ {len(skipped)}건은 다른 사용자가 이미 처리했거나 발주내역에서 찾을 수 없어 건너뛰었습니다.")
                     time.sleep(1.5)
                     st.rerun()
 
+        # 4. 입고완료 건 보관 (발주내역 시트를 미입고 건 위주로 가볍게 유지)
+        with st.expander("🗄️ 입고완료 건 보관 처리"):
+            st.caption(f"'발주완료'가 아닌 행을 '{ARCHIVE_SHEET}' 시트로 옮기고 발주내역에서 삭제합니다.")
+            if st.button("보관 시트로 이동"):
+                with st.spinner("보관 처리 중..."):
+                    moved = archive_closed_orders(storage)
+                    # 행 번호가 바뀌므로 증분 상태를 버리고 전체 재로딩
+                    order_log.reset()
+                    analytics.reset(ORD_SHEET)
+                    sheet_cache.invalidate(ORD_SHEET)
+                    change_detector.mark_written(storage, ORD_SHEET, ARCHIVE_SHEET)
+                st.success(f"{moved}건을 보관 시트로 옮겼습니다.")
+                st.rerun()
+
+    # 5. 재고 현황 / 출고·조정 (재고이력에 변동 행 추가)
+    with st.expander("📒 재고 현황 / 출고·조정"):
+        st.caption("재고 기준은 재고스냅샷 + 재고이력입니다. 자재마스터 '현재재고' 열은 스냅샷을 만들 때 덮어쓰는 사본이므로, 재고를 고칠 때는 '조정'으로 기록하세요.")
+        df_mat = load_materials()
+        stock = stock_map()
+        if '자재코드' in df_mat.columns:
+            f1, f2 = st.columns(2)
+            with f1: f_sup = st.multiselect("매입처", sorted(df_mat['매입처'].astype(str).unique()) if '매입처' in df_mat.columns else [], key="stock_f_sup")
+            with f2: f_text = st.text_input("검색 (자재코드/품명/규격)", key="stock_f_text")
+            # 거른 행만 재고를 붙여서 현재 페이지만 브라우저로 보냄
+            shown = filter_frame(df_mat, isin={'매입처': f_sup}, text=f_text, text_cols=('자재코드', '품명', '규격'))
+            stock_view = shown[[c for c in ('자재코드', '품명', '규격', '매입처') if c in shown.columns]].astype(str)
+            stock_view = stock_view.assign(현재재고=stock_view['자재코드'].map(stock).fillna(0).astype(int))
+            paged_editor(stock_view, "stock_view", [], version=sheet_cache.version(MAT_SHEET),
+                         disabled=True, hide_index=True, use_container_width=True)
 
+            # 자재코드 선택지는 현재 페이지의 자재만 (검색으로 좁혀서 선택)
+            page = st.session_state.get("stock_view_page", 1)
+            page_codes = list(dict.fromkeys(stock_view['자재코드'].iloc[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]))
+            c1, c2, c3, c4 = st.columns([2, 1, 1, 2])
+            with c1: move_code = st.selectbox("자재코드", page_codes, key="move_code")
+            with c2: move_kind = st.selectbox("구분", [MOVE_ISSUE, MOVE_ADJUST], key="move_kind")
+            with c3: move_qty = st.number_input("수량 (조정은 ±)", value=1, step=1, key="move_qty")
+            with c4: move_note = st.text_input("비고", key="move_note")
+            if st.button("📝 재고 변동 기록") and move_code and move_qty:
+                write_queue.append_rows(LEDGER_SHEET, [stock_movement(move_code, move_kind, move_qty, note=move_note)])
+                st.toast(f"{move_code} {move_kind} {move_qty} 기록 (반영 대기)")
+        if st.button("🗜️ 재고 스냅샷 지금 만들기"):
+            with st.spinner("재고이력 압축 중..."):
+                count = compact_stock(storage, stock_ledger)
+                change_detector.mark_written(storage, SNAPSHOT_SHEET, MAT_SHEET)
+                sheet_cache.invalidate(MAT_SHEET, LEDGER_SHEET)
+            st.success(f"{count}개 자재 재고 스냅샷 저장")
 
+# [탭 4] 영업/구매 분석
+@st.fragment
+def render_analytics_view():
+    st.header("📊 영업 / 구매 분석")
+    notify_remote_changes()
+    stats = load_analytics()
+    df_mat = load_materials()
+
+    # 1. 견적 (설비 / 월별)
+    st.subheader("1. 견적 현황 (설비 / 월별)")
+    quotes = stats.quote_frame()
+    if quotes.empty: st.info("저장된 견적이 없습니다.")
+    else:
+        c1, c2 = st.columns(2)
+        c1.metric("견적 건수", f"{quotes['견적건수'].sum():,} 건")
+        c2.metric("견적 총액", f"{quotes['견적총액'].sum():,.0f} 원")
+        st.dataframe(quotes.pivot_table(index="월", columns="설비", values="견적총액", aggfunc="sum", fill_value=0)
+                     .sort_index(ascending=False), use_container_width=True)
+        st.dataframe(quotes, hide_index=True, use_container_width=True)
+
+    # 2. 구매 (거래처 / 자재코드별)
+    st.subheader("2. 구매 수량 (거래처 / 자재코드별)")
+    purchases = stats.purchase_frame()
+    if purchases.empty: st.info("발주 내역이 없습니다.")
+    else:
+        by_supplier = purchases.groupby("거래처", as_index=False)[["발주건수", "발주수량"]].sum()
+        st.dataframe(by_supplier.sort_values("발주수량", ascending=False), hide_index=True, use_container_width=True)
+        with st.expander(f"자재코드별 상세 ({len(purchases)}건)"):
+            st.dataframe(purchases, hide_index=True, use_container_width=True)
+
+    # 3. 리드타임 (발주 -> 입고)
+    st.subheader("3. 입고 리드타임 (발주 → 입고)")
+    lead = stats.lead_time_frame()
+    if lead.empty: st.info("발주ID 가 기록된 입고 이력이 없습니다.")
+    else:
+        if {'자재코드', '매입처'} <= set(df_mat.columns):
+            suppliers = dict(zip(df_mat['자재코드'].astype(str), df_mat['매입처'].astype(str)))
+            lead.insert(1, "매입처", lead['자재코드'].map(suppliers).fillna("-"))
+        st.metric("전체 평균 리드타임", f"{(lead['평균리드타임(일)'] * lead['입고건수']).sum() / lead['입고건수'].sum():.1f} 일")
+        st.dataframe(lead, hide_index=True, use_container_width=True)
+
+
+VIEWS = {
+    "📑 견적 관리(영업)": render_quote_view,
+    "📦 자재 발주(구매)": render_order_view,
+    "✅ 입고 확인(창고)": render_receiving_view,
+    "📊 영업/구매 분석": render_analytics_view,
+}
+active_view = st.radio("화면 선택", list(VIEWS), horizontal=True, key="active_view", label_visibility="collapsed")
+st.divider()
+VIEWS[active_view]()
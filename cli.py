@@ -0,0 +1,320 @@
+"""
+화면 없이 실행하는 일괄 작업 (야간 작업 / 대량 처리용)
+- 스트림릿을 import 하지 않고 core / storage / order_pdf 를 그대로 사용
+- 입력은 한 줄씩 읽고, 저장소에는 묶음 단위 일괄 호출
+
+사용 예)
+  python cli.py match --equip 탑밀 --capa 30 --explo "안전증방폭(eG3)" --mat "SUS304 (스텐)" --qty 2 > parts.csv
+  python cli.py pending-pos --out-dir ./발주서
+  python cli.py receive delivered.csv --chunk 500
+  python cli.py mrp plan.csv --out-dir ./발주서 > 소요량.csv
+  python cli.py import-materials 신규자재.csv
+  python cli.py order 프로젝트발주.csv --out-dir ./발주서
+  python cli.py compact-stock
+
+저장소 선택은 앱과 같은 환경변수 사용 (STORAGE_BACKEND / SQLITE_PATH)
+구글 시트는 service_account.json (또는 --credentials) 로 인증
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import datetime
+from itertools import islice
+
+import gspread
+import pandas as pd
+from oauth2client.service_account import ServiceAccountCredentials
+
+from core import (
+    ApplicabilityIndex, CodeAllocator, build_order_rows, explode_plan, match_cart_lines, plan_material_import,
+    plan_to_cart, receive_orders, to_int
+)
+from order_pdf import render_orders
+from sheets_client import wrap_client
+from storage import (
+    LEDGER_SHEET, MAT_SHEET, ORD_SHEET, REAL_SHEET_URL, OrderLog, SQLiteStorage, StockLedger, compact_stock, open_sheets,
+    opening_movements
+)
+from write_queue import WriteBehindQueue
+
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+
+def open_storage(args):
+    if args.backend == "sqlite":
+        return SQLiteStorage(args.sqlite_path)
+    with open(args.credentials, encoding="utf-8") as f:
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(json.load(f), SCOPE)
+    client = wrap_client(gspread.authorize(creds),
+                         int(os.environ.get("SHEETS_READS_PER_MIN", "60")),
+                         int(os.environ.get("SHEETS_WRITES_PER_MIN", "60")))
+    return open_sheets(client, args.sheet_url)
+
+
+def log(msg):
+    print(msg, file=sys.stderr)
+
+# -----------------------------------------------------
+# 1. 설비 사양 -> 자재 목록
+# -----------------------------------------------------
+def cmd_match(storage, args):
+    df_mat = storage.read_frame(MAT_SHEET)
+    index = ApplicabilityIndex(df_mat['적용설비'].tolist() if '적용설비' in df_mat.columns else [])
+    selection = {"equip": args.equip, "capa": str(args.capa), "explo": args.explo, "mat": args.mat}
+    positions = index.match(selection)
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["자재코드", "품명", "규격", "매입처", "수량", "비고"])
+    note = f"{args.equip}{args.capa}용"
+    for row in df_mat.iloc[positions].to_dict('records'):
+        writer.writerow([row.get('자재코드', ''), row.get('품명', ''), row.get('규격', ''), row.get('매입처', ''), args.qty, note])
+    log(f"{len(positions)}개 자재 검색됨")
+    return 0
+
+# -----------------------------------------------------
+# 2. 입고 대기 발주 -> 거래처별 발주서 PDF
+# -----------------------------------------------------
+def cmd_pending_pos(storage, args):
+    order_log = OrderLog()
+    order_log.refresh(storage)
+    pending = order_log.pending_frame()
+    if pending.empty:
+        log("입고 대기 발주가 없습니다.")
+        return 0
+
+    # 규격은 발주내역에 없으므로 자재마스터에서 자재코드로 조회
+    df_mat = storage.read_frame(MAT_SHEET)
+    spec_map = dict(zip(df_mat['자재코드'], df_mat['규격'])) if '규격' in df_mat.columns else {}
+
+    carts = {}
+    for row in pending.to_dict('records'):
+        sup = str(row['거래처']).strip() or "미지정"
+        if args.supplier and sup not in args.supplier: continue
+        carts.setdefault(sup, []).append({
+            'name': row['품명'], 'spec': spec_map.get(str(row['자재코드']), ''),
+            'qty': int(row['수량']), 'note': row['비고'],
+        })
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    written = 0
+    for file_name, data in render_orders(carts):
+        if not data: continue
+        with open(os.path.join(args.out_dir, file_name), "wb") as f:
+            f.write(data)
+        written += 1
+        log(f"생성: {file_name}")
+    if carts and not written:
+        log("발주서 생성 실패 (한글 폰트 준비 실패)")
+        return 1
+    log(f"{written}개 거래처 발주서 생성 완료")
+    return 0
+
+# -----------------------------------------------------
+# 3. 입고 CSV 일괄 처리
+# -----------------------------------------------------
+def cmd_receive(storage, args):
+    """
+    CSV 열: 발주ID, 자재코드 (둘 다 일치하는 입고 대기 행을 위에서부터 1건씩 입고)
+    수량 열이 있으면 그 수량으로, 없으면 발주 수량으로 재고 반영 (발주 수량보다 적으면 입고하지 않고 미일치로 집계)
+    """
+    order_log = OrderLog()
+    order_log.refresh(storage)
+    # (발주ID, 자재코드) -> 입고 대기 행번호 목록 (행 순서)
+    open_lines = {}
+    for row_no in sorted(order_log.pending):
+        row = order_log.pending[row_no]
+        open_lines.setdefault((row[0].strip(), row[7].strip()), []).append((row_no, to_int(row[4]), row))
+
+    df_mat = storage.read_frame(MAT_SHEET)
+    # 재고이력은 파일 큐를 거쳐서 추가 (입고완료 표시 뒤 추가가 실패해도 다음 실행 때 먼저 반영)
+    ledger_queue = WriteBehindQueue(storage, args.queue_path)
+    if not args.dry_run:
+        while ledger_queue.flush_once(): pass
+    received, unmatched = 0, 0
+    with open(args.csv, newline="", encoding=args.encoding) as f:
+        reader = csv.DictReader(f)
+        while True:
+            chunk = list(islice(reader, args.chunk))
+            if not chunk: break
+            recv_lines = []
+            for line in chunk:
+                key = (str(line.get('발주ID', '')).strip(), str(line.get('자재코드', '')).strip())
+                queue = open_lines.get(key)
+                if not queue:
+                    unmatched += 1
+                    log(f"대기 중인 발주 없음: {key[0]} / {key[1]}")
+                    continue
+                row_no, ordered_qty, row = queue[0]
+                qty = to_int(line['수량']) if str(line.get('수량') or '').strip() else ordered_qty
+                if qty < ordered_qty:
+                    # 부분 입고는 받지 않음 (입고완료로 닫으면 남은 수량이 입고 대기 / 소요량 / 발주점 계산에서 빠짐)
+                    unmatched += 1
+                    log(f"부분 입고 제외 (발주 {ordered_qty}, 납품 {qty}): {key[0]} / {key[1]}")
+                    continue
+                queue.pop(0)
+                recv_lines.append((row_no, key[1], qty, key[0], row))
+            if not recv_lines: continue
+            if args.dry_run:
+                received += len(recv_lines)
+                continue
+            # 재고는 재고이력에 행 추가만 하므로 묶음 사이에 자재마스터를 다시 읽을 필요 없음
+            done, skipped = receive_orders(storage, recv_lines, df_mat, order_log=order_log, append_rows=ledger_queue.append_rows)
+            while ledger_queue.flush_once(): pass
+            received += done
+            unmatched += len(skipped)
+            for _, code, _, order_id, _ in skipped:
+                log(f"이미 입고됐거나 찾을 수 없음: {order_id} / {code}")
+            log(f"입고 처리: 누적 {received}건")
+
+    log(f"완료: 입고 {received}건, 미일치 {unmatched}건" + (" (dry-run, 반영 안 함)" if args.dry_run else ""))
+    return 1 if unmatched and args.strict else 0
+
+# -----------------------------------------------------
+# 4. 생산계획 -> 순소요량 (MRP)
+# -----------------------------------------------------
+def cmd_mrp(storage, args):
+    """CSV 열: 설비, 용량, 방폭, 재질, 대수 -> 자재코드별 순소요량 CSV (선택: 부족분 거래처별 발주서)"""
+    with open(args.plan, newline="", encoding=args.encoding) as f:
+        plan = list(csv.DictReader(f))
+    df_mat = storage.read_frame(MAT_SHEET)
+    index = ApplicabilityIndex(df_mat['적용설비'].tolist() if '적용설비' in df_mat.columns else [])
+    order_log = OrderLog()
+    order_log.refresh(storage)
+    ledger = StockLedger()
+    ledger.refresh(storage)
+    result = explode_plan(df_mat, index, plan, order_log.pending_frame(), ledger.stock())
+    result.to_csv(sys.stdout, index=False)
+    log(f"자재 {len(result)}종, 부족 {int((result['순소요량'] > 0).sum())}종")
+
+    if args.out_dir:
+        carts = {}
+        for item in plan_to_cart(result, f"생산계획 {sum(to_int(r.get('대수')) for r in plan)}대"):
+            carts.setdefault(item['supplier'] or "미지정", []).append(item)
+        os.makedirs(args.out_dir, exist_ok=True)
+        for file_name, data in render_orders(carts):
+            if not data: continue
+            with open(os.path.join(args.out_dir, file_name), "wb") as f:
+                f.write(data)
+            log(f"생성: {file_name}")
+    return 0
+
+# -----------------------------------------------------
+# 5. 자재마스터 일괄 등록
+# -----------------------------------------------------
+def cmd_import_materials(storage, args):
+    if args.file.lower().endswith(".xlsx"): df_in = pd.read_excel(args.file, dtype=str)
+    else: df_in = pd.read_csv(args.file, dtype=str, keep_default_na=False, encoding=args.encoding)
+    new_rows, skipped = plan_material_import(df_in, storage.read_frame(MAT_SHEET), CodeAllocator())
+    for _, row in skipped.iterrows():
+        log(f"제외 ({row['사유']}): {row.get('매입처', '')} / {row.get('품명', '')} / {row.get('규격', '')}")
+    if new_rows and not args.dry_run:
+        storage.append_rows(MAT_SHEET, new_rows)
+        storage.append_rows(LEDGER_SHEET, opening_movements(new_rows))
+    log(f"등록 {len(new_rows)}건, 제외 {len(skipped)}건" + (" (dry-run, 반영 안 함)" if args.dry_run else ""))
+    return 0
+
+# -----------------------------------------------------
+# 6. 발주 목록 CSV -> 전체 발주 확정
+# -----------------------------------------------------
+def cmd_order(storage, args):
+    """CSV 열: 자재코드 또는 품명+규격 (매입처 선택), 수량, 비고 -> 발주내역 일괄 추가 1회 + 거래처별 발주서"""
+    df_in = pd.read_csv(args.file, dtype=str, keep_default_na=False, encoding=args.encoding)
+    items, unmatched = match_cart_lines(df_in, storage.read_frame(MAT_SHEET))
+    for _, row in unmatched.iterrows():
+        log(f"매칭 실패: {row.get('자재코드', '')} {row.get('품명', '')} {row.get('규격', '')}")
+    if unmatched.size and args.strict:
+        log("매칭 실패 행이 있어 발주하지 않았습니다.")
+        return 1
+    if not items:
+        log("발주할 품목이 없습니다.")
+        return 0
+
+    now = datetime.now()
+    if not args.dry_run:
+        storage.append_rows(ORD_SHEET, build_order_rows(items, now.strftime("%y%m%d%H%M"), now.strftime("%Y-%m-%d")))
+    carts = {}
+    for item in items:
+        carts.setdefault(item['supplier'] or "미지정", []).append(item)
+    log(f"발주 {len(items)}건 ({len(carts)}개 거래처)" + (" (dry-run, 반영 안 함)" if args.dry_run else ""))
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+        for file_name, data in render_orders(carts):
+            if not data: continue
+            with open(os.path.join(args.out_dir, file_name), "wb") as f:
+                f.write(data)
+            log(f"생성: {file_name}")
+    return 0
+
+# -----------------------------------------------------
+# 7. 재고이력 -> 재고스냅샷 압축 (야간 작업용)
+# -----------------------------------------------------
+def cmd_compact_stock(storage, args):
+    count = compact_stock(storage, StockLedger())
+    log(f"{count}개 자재 재고 스냅샷 저장")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="베스트 화학 ERP 일괄 작업")
+    parser.add_argument("--backend", choices=["sheets", "sqlite"], default=os.environ.get("STORAGE_BACKEND", "sheets"))
+    parser.add_argument("--sqlite-path", default=os.environ.get("SQLITE_PATH", "erp.db"))
+    parser.add_argument("--credentials", default="service_account.json")
+    parser.add_argument("--sheet-url", default=REAL_SHEET_URL)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("match", help="설비 사양에 맞는 자재 목록을 CSV 로 출력")
+    p.add_argument("--equip", required=True)
+    p.add_argument("--capa", required=True)
+    p.add_argument("--explo", default="비방폭")
+    p.add_argument("--mat", default="SS400 (철)")
+    p.add_argument("--qty", type=int, default=1, help="자재별 수량")
+    p.set_defaults(func=cmd_match)
+
+    p = sub.add_parser("pending-pos", help="입고 대기 발주를 거래처별 발주서 PDF 로 저장")
+    p.add_argument("--out-dir", required=True)
+    p.add_argument("--supplier", action="append", help="특정 거래처만 (여러 번 지정 가능)")
+    p.set_defaults(func=cmd_pending_pos)
+
+    p = sub.add_parser("receive", help="납품 CSV 로 일괄 입고 처리")
+    p.add_argument("csv")
+    p.add_argument("--chunk", type=int, default=1000, help="저장소 일괄 호출 1회당 행 수")
+    p.add_argument("--encoding", default="utf-8-sig")
+    p.add_argument("--dry-run", action="store_true")
+    p.add_argument("--strict", action="store_true", help="미일치 행이 있으면 종료 코드 1")
+    p.add_argument("--queue-path", default="cli_write_queue.db", help="재고이력 쓰기 큐 파일 (실패한 추가는 다음 실행 때 반영)")
+    p.set_defaults(func=cmd_receive)
+
+    p = sub.add_parser("mrp", help="생산계획 CSV 로 자재별 순소요량 계산")
+    p.add_argument("plan")
+    p.add_argument("--out-dir", help="지정하면 부족분을 거래처별 발주서 PDF 로 저장")
+    p.add_argument("--encoding", default="utf-8-sig")
+    p.set_defaults(func=cmd_mrp)
+
+    p = sub.add_parser("import-materials", help="CSV / 엑셀로 자재마스터 일괄 등록 (자재코드 자동 발급)")
+    p.add_argument("file")
+    p.add_argument("--encoding", default="utf-8-sig")
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_import_materials)
+
+    p = sub.add_parser("order", help="발주 목록 CSV 를 자재마스터와 매칭해서 전체 발주 확정")
+    p.add_argument("file")
+    p.add_argument("--out-dir", help="지정하면 거래처별 발주서 PDF 저장")
+    p.add_argument("--encoding", default="utf-8-sig")
+    p.add_argument("--dry-run", action="store_true")
+    p.add_argument("--strict", action="store_true", help="매칭 실패 행이 있으면 발주하지 않음")
+    p.set_defaults(func=cmd_order)
+
+    p = sub.add_parser("compact-stock", help="재고이력을 재고스냅샷으로 압축하고 자재마스터 '현재재고' 열을 같은 값으로 갱신")
+    p.set_defaults(func=cmd_compact_stock)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(open_storage(args), args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
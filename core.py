@@ -0,0 +1,1069 @@
+"""
+화면(스트림릿)과 무관한 핵심 로직
+- import 시 부작용 없음 (시트 연결 / 파일 다운로드 / 스트림릿 호출 없음)
+- 앱(app.py) 과 백그라운드 작업이 함께 사용
+"""
+import heapq
+import re
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from storage import (
+    MAT_SHEET, ORD_SHEET, QUOTE_SHEET, ARCHIVE_SHEET, LEDGER_SHEET, ORD_STATUS_COL, MAT_STOCK_COL, MAT_HEADERS, ORD_HEADERS, QUOTE_HEADERS,
+    INT_COLUMNS, MOVE_RECEIPT, parse_int_column, stock_movement
+)
+
+# -----------------------------------------------------
+# 1. 유틸리티 함수
+# -----------------------------------------------------
+PREFIX_MAP = {
+    '모터': 'MTR', '감속기': 'MTR', '펌프': 'PMP', '베어링': 'BRG', '유니트': 'BRG',
+    '밸브': 'VLV', '파이프': 'PIP', '엘보': 'PIP', '티': 'PIP', '소켓': 'PIP',
+    '플랜지': 'FLG', '볼트': 'BLT', '너트': 'BLT', '인버터': 'ELC', '스위치': 'ELC',
+    '판': 'RAW', '앵글': 'RAW', '환봉': 'RAW', 'SUS': 'RAW', '씰': 'SEL'
+}
+
+# PREFIX_MAP 키 전체를 한 번에 찾는 정규식 (전방탐색이라 겹치는 위치도 모두 찾음, 앞 키가 우선)
+_PREFIX_KEYS = list(PREFIX_MAP)
+_PREFIX_PATTERN = re.compile("(?=(" + "|".join(re.escape(k) for k in _PREFIX_KEYS) + "))")
+_SPEC_STRIP = re.compile(r'[^a-zA-Z0-9가-힣]')
+
+def classify_item(name):
+    """품명 -> 품목 코드 (PREFIX_MAP 에서 먼저 나온 키가 우선, 없으면 ETC)"""
+    found = [_PREFIX_KEYS.index(m.group(1)) for m in _PREFIX_PATTERN.finditer(str(name))]
+    return PREFIX_MAP[_PREFIX_KEYS[min(found)]] if found else "ETC"
+
+def generate_smart_code(supplier, name, spec):
+    sup_code = supplier[:2] if supplier else "XX"
+    item_code = classify_item(name)
+    spec_clean = _SPEC_STRIP.sub('', str(spec))
+    spec_code = spec_clean[:3].upper() if spec_clean else "000"
+    return f"{sup_code}-{item_code}-{spec_code}"
+
+def smart_code_bases(suppliers, names, specs):
+    """generate_smart_code 의 일괄 버전 (품명/규격은 고유값별로 1회만 분류)"""
+    suppliers, names, specs = (pd.Series(list(v), dtype=object).fillna("").astype(str) for v in (suppliers, names, specs))
+    sup_code = suppliers.str[:2].where(suppliers != "", "XX")
+    item_code = names.map({n: classify_item(n) for n in names.unique()})
+    spec_clean = specs.str.replace(_SPEC_STRIP, '', regex=True)
+    spec_code = spec_clean.str[:3].str.upper().where(spec_clean != "", "000")
+    return (sup_code + "-" + item_code + "-" + spec_code).tolist()
+
+class CodeAllocator:
+    """
+    '기본코드-001' 형식의 일련번호 접미사 발급 (같은 초에 여러 건을 등록해도 중복 없음)
+    - 기존 자재코드 색인에서 기본코드별 최대 번호를 찾아 그 다음 번호부터 발급
+    - 발급한 코드는 시트에 반영되기 전에도 기억 (쓰기 큐 대기 중 중복 방지)
+    """
+    _SEQ = re.compile(r'^(.*)-(\d+)$')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._issued = set()
+
+    def allocate(self, bases, existing_codes):
+        taken = set(str(c) for c in existing_codes)
+        with self._lock:
+            taken |= self._issued
+            last = {}
+            for code in taken:
+                m = self._SEQ.match(code)
+                if m: last[m.group(1)] = max(last.get(m.group(1), 0), int(m.group(2)))
+            codes = []
+            for base in bases:
+                seq = last.get(base, 0) + 1
+                while f"{base}-{seq:03d}" in taken: seq += 1
+                code = f"{base}-{seq:03d}"
+                last[base] = seq
+                taken.add(code)
+                codes.append(code)
+            self._issued.update(codes)
+        return codes
+
+# -----------------------------------------------------
+# 2. 적용설비 매칭 로직 (수정된 버전)
+# -----------------------------------------------------
+HORIZONTAL_MILLS = ["베스트밀", "퍼펙트밀", "탑밀"]  # '횡형밀' 그룹에 속하는 설비
+
+# 용량 매핑 데이터 (견적/발주 화면 공용)
+CAPACITY_MAP = {
+    "베스트밀": [5, 10, 30, 40, 50],
+    "퍼펙트밀": [5, 10, 30, 40, 50],
+    "탑밀": [20, 30, 40, 50],
+    "바스켓밀": ["1~4L", "20~40L", "100L", "200L", "300L", "500L", "1000L", "3000L", "5000L"],
+    "충진기": ["1구", "2구"]
+}
+
+def normalize_capa(raw_capa):
+    # [핵심 수정 1] 숫자만 있는 용량(30) 뒤에 강제로 'L'을 붙여서 비교
+    # 30 -> 30L, 1~4L -> 1~4L (그대로)
+    raw_capa = str(raw_capa)
+    return raw_capa + "L" if raw_capa.isdigit() else raw_capa
+
+def build_option_keywords(sel_explo_raw, sel_mat_raw):
+    # [핵심 수정 2] 매칭 키워드 확장 (유연성 확보)
+    # 사용자가 '안전증방폭(eG3)'을 선택했다면 -> ['방폭', 'eG3', 'EG3', '안전증'] 키워드를 모두 가짐
+    current_options = []
+    
+    # 1. 방폭 관련 키워드 생성
+    if "비방폭" in sel_explo_raw:
+        current_options.append("비방폭")
+    else:
+        current_options.append("방폭") # 기본적으로 방폭임
+        if "eG3" in sel_explo_raw or "EG3" in sel_explo_raw:
+            current_options.extend(["eG3", "EG3", "안전증"])
+        if "d2G4" in sel_explo_raw:
+            current_options.extend(["d2G4", "내압"])
+
+    # 2. 재질 관련 키워드 생성
+    if "SUS" in sel_mat_raw or "스텐" in sel_mat_raw:
+        current_options.extend(["스텐", "SUS", "써스"])
+    else:
+        current_options.extend(["철", "SS400", "일반"])
+    return current_options
+
+def check_applicability(tag_string, selection):
+    """
+    tag_string: 시트의 '적용설비' 값 (예: '탑밀30L-철@, 횡형밀@')
+    selection: 사용자가 선택한 값 딕셔너리
+    """
+    if not tag_string or str(tag_string).strip() == "": return False
+    
+    # 태그를 쉼표로 분리 (공백 제거 포함)
+    tags = [t.strip() for t in str(tag_string).split(',')]
+    
+    sel_equip = selection['equip']   # 예: 탑밀
+    sel_capa = normalize_capa(selection['capa']) # 예: 30 -> 30L
+    
+    # 예: 안전증방폭(eG3), SUS304 (스텐)
+    current_options = build_option_keywords(selection['explo'], selection['mat'])
+
+    # --- 태그 검사 시작 ---
+    for tag in tags:
+        # 태그가 비어있으면 패스
+        if not tag: continue
+
+        # 1. '횡형밀' 특수 그룹 체크
+        if "횡형밀" in tag:
+            if sel_equip in HORIZONTAL_MILLS: 
+                # 횡형밀이라도 뒤에 옵션(예: 횡형밀@-스텐@)이 붙을 수 있으므로 아래 로직을 태움
+                pass 
+            else:
+                continue # 횡형밀이 아니면 다음 태그로
+
+        # 태그 분해 (예: 탑밀30L-철@ -> ['탑밀30L', '철@'])
+        tokens = [t.strip().replace("@", "") for t in tag.split('-')]
+        head = tokens[0] # 설비명 부분
+        
+        # 2. 설비명 및 용량 일치 여부 확인
+        is_equip_match = False
+        
+        # Case A: '횡형밀' 같은 그룹명인 경우 (이미 위에서 필터링 했으므로 통과)
+        if "횡형밀" in head:
+            is_equip_match = True
+            
+        # Case B: '탑밀' 처럼 용량 없이 설비명만 있는 경우 (@가 붙어있거나 텍스트만 일치)
+        elif head == sel_equip:
+            is_equip_match = True
+            
+        # Case C: '탑밀30L' 처럼 용량까지 지정된 경우
+        # 아까 만든 sel_capa ("30L")와 결합해서 비교
+        elif head == f"{sel_equip}{sel_capa}":
+            is_equip_match = True
+            
+        # 설비 조건이 안 맞으면 이 태그는 탈락
+        if not is_equip_match:
+            continue
+
+        # 3. 옵션(재질/방폭) 상세 일치 여부 확인
+        # tokens[1:] 부터는 '철', '방폭', 'EG3' 같은 조건들임
+        # 이 조건들이 위에서 만든 current_options 리스트에 다 들어있어야 함
+        
+        is_option_match = True
+        if len(tokens) > 1:
+            for req in tokens[1:]:
+                # 태그에 적힌 조건(req)이 현재 내 상황(current_options)에 없으면 탈락
+                # 대소문자 무시를 위해 upper() 사용 추천하지만, 일단 단순 비교
+                match_found = False
+                for my_opt in current_options:
+                    if req.upper() == my_opt.upper():
+                        match_found = True
+                        break
+                
+                if not match_found:
+                    is_option_match = False
+                    break
+        
+        if is_option_match:
+            return True # 하나라도 조건에 맞는 태그를 찾으면 즉시 성공!
+            
+    return False
+
+class ApplicabilityIndex:
+    """
+    '적용설비' 태그를 한 번만 분해해서 만든 역색인
+    설비명 / 설비명+용량 / '횡형밀' 그룹 -> {(필요 옵션 집합, 횡형밀 전용 여부): 행 위치 집합}
+    매칭 결과는 check_applicability 와 동일하며, 선택값 조합별로 메모이즈됨
+    """
+    GROUP = "횡형밀"
+
+    def __init__(self, tag_values):
+        self._index = {}
+        self._memo = {}
+        for pos, tag_string in enumerate(tag_values):
+            if not tag_string or str(tag_string).strip() == "": continue
+            for tag in str(tag_string).split(','):
+                tag = tag.strip()
+                if not tag: continue
+                # 태그 분해 (예: 탑밀30L-철@ -> ['탑밀30L', '철'])
+                tokens = [t.strip().replace("@", "") for t in tag.split('-')]
+                head = self.GROUP if self.GROUP in tokens[0] else tokens[0]
+                # 태그 어디든 '횡형밀'이 있으면 횡형밀 계열 설비에서만 유효
+                group_only = self.GROUP in tag
+                required = frozenset(t.upper() for t in tokens[1:])
+                self._index.setdefault(head, {}).setdefault((required, group_only), set()).add(pos)
+
+    def match(self, selection):
+        """조건에 맞는 행 위치(0부터)를 정렬된 리스트로 반환"""
+        key = (selection['equip'], str(selection['capa']), selection['explo'], selection['mat'])
+        if key in self._memo: return self._memo[key]
+
+        sel_equip, raw_capa, sel_explo, sel_mat = key
+        options = {o.upper() for o in build_option_keywords(sel_explo, sel_mat)}
+        in_group = sel_equip in HORIZONTAL_MILLS
+
+        rows = set()
+        for head in {sel_equip, f"{sel_equip}{normalize_capa(raw_capa)}", self.GROUP}:
+            for (required, group_only), positions in self._index.get(head, {}).items():
+                if group_only and not in_group: continue
+                if required <= options:
+                    rows |= positions
+
+        result = sorted(rows)
+        self._memo[key] = result
+        return result
+
+
+# -----------------------------------------------------
+# 2-1. 자재마스터 조회 색인 (개별 발주 선택 상자 / 단가 / 자재코드)
+# -----------------------------------------------------
+class MasterIndex:
+    """
+    자재마스터를 한 번만 훑어서 만든 조회용 색인
+    - 거래처 -> 품명 -> 규격 트리 (선택 상자 목록, 미리 정렬)
+    - (매입처, 품명, 규격) -> 자재코드 / 단가 해시맵 (같은 키가 여러 행이면 첫 행)
+    """
+    def __init__(self, df_mat):
+        tree = {}
+        self._rows = {}
+        cols = [c for c in ('매입처', '품명', '규격', '자재코드', '단가') if c in df_mat.columns]
+        for rec in df_mat[cols].to_dict('records'):
+            sup = str(rec.get('매입처', '')).strip()
+            item, spec = str(rec.get('품명', '')), str(rec.get('규격', ''))
+            if sup: tree.setdefault(sup, {}).setdefault(item, set()).add(spec)
+            self._rows.setdefault((sup, item, spec), {'자재코드': rec.get('자재코드', ''), '단가': int(rec.get('단가', 0))})
+        self._items = {sup: sorted(items) for sup, items in tree.items()}
+        self._specs = {(sup, item): sorted(specs) for sup, items in tree.items() for item, specs in items.items()}
+        self.suppliers = sorted(tree)
+
+    def items(self, supplier):
+        return self._items.get(supplier, [])
+
+    def specs(self, supplier, item):
+        return self._specs.get((supplier, item), [])
+
+    def lookup(self, supplier, item, spec):
+        """{'자재코드', '단가'} 또는 None"""
+        return self._rows.get((str(supplier).strip(), str(item), str(spec)))
+
+# -----------------------------------------------------
+# 3. 공용 데이터 캐시 (모든 세션 공유)
+# -----------------------------------------------------
+class SheetCache:
+    """
+    시트별 파싱된 DataFrame 을 프로세스 전체에서 공유하는 캐시
+    - 재실행(rerun)마다 시트를 다시 읽지 않음
+    - 이 앱이 시트에 쓸 때 invalidate() 로 해당 시트만 무효화 -> 다음 조회 시 1회 재로딩
+    - version 은 재로딩될 때마다 증가 (파생 인덱스 캐시 키로 사용)
+    - 읽는 도중에 invalidate() 가 오면 (세대 번호 변경) 읽은 결과를 저장하지 않고 다시 읽음
+    - derive() 로 만든 파생 데이터(적용설비 역색인 등)는 시트 버전이 같으면 재사용
+    """
+    MAX_RELOADS = 3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._frames = {}    # 시트명 : (DataFrame, 버전)
+        self._versions = {}
+        self._generations = {}  # 시트명 : invalidate() 횟수 (읽는 도중 무효화 확인용)
+        self._derived = {}   # (시트명, 키) : (버전, 파생 데이터)
+
+    def _load_lock(self, name):
+        with self._lock:
+            return self._load_locks.setdefault(name, threading.Lock())
+
+    def _entry(self, name, loader):
+        entry = self._frames.get(name)
+        if entry is not None: return entry
+        # 같은 시트를 여러 세션이 동시에 요청해도 한 번만 읽음
+        with self._load_lock(name):
+            entry = self._frames.get(name)
+            for _ in range(self.MAX_RELOADS):
+                if entry is not None: break
+                generation = self._generations.get(name, 0)
+                frame = loader()
+                with self._lock:
+                    version = self._versions[name] = self._versions.get(name, 0) + 1
+                    # 읽는 사이 무효화됐으면 쓰기 전 값일 수 있으므로 저장하지 않음
+                    if self._generations.get(name, 0) == generation: entry = self._frames[name] = (frame, version)
+            # 계속 무효화되면 마지막으로 읽은 값만 돌려주고 캐시는 비워 둠
+            if entry is None: entry = (frame, version)
+        return entry
+
+    def get(self, name, loader):
+        # 얕은 복사본을 반환 (copy-on-write: 호출한 쪽에서 열을 추가/수정해도 공유 캐시는 그대로)
+        return self._entry(name, loader)[0].copy(deep=False)
+
+    def derive(self, name, key, loader, builder):
+        """시트 DataFrame 으로 만든 파생 데이터 (builder(frame)) 를 시트 버전별로 1회만 생성"""
+        frame, version = self._entry(name, loader)
+        cached = self._derived.get((name, key))
+        if cached is not None and cached[0] == version: return cached[1]
+        with self._load_lock((name, key)):
+            cached = self._derived.get((name, key))
+            if cached is None or cached[0] != version:
+                cached = self._derived[(name, key)] = (version, builder(frame))
+        return cached[1]
+
+    def version(self, name):
+        return self._versions.get(name, 0)
+
+    def is_loaded(self, name):
+        return name in self._frames
+
+    def load(self, name, loader):
+        """DataFrame 이 아닌 값 (증분 색인 객체 등) 을 복사 없이 그대로 캐시"""
+        return self._entry(name, loader)[0]
+
+    def invalidate(self, *names):
+        with self._lock:
+            for name in names:
+                self._frames.pop(name, None)
+                self._generations[name] = self._generations.get(name, 0) + 1
+
+# -----------------------------------------------------
+# 4. 원격 변경 감지 (시트에서 직접 수정한 내용 반영)
+# -----------------------------------------------------
+class SheetChangeDetector:
+    """
+    전체 재조회 없이 시트 변경 여부만 가볍게 확인하는 폴링 레이어
+    - 저장소의 fingerprints() 로 시트별 지문을 1회 조회
+      (구글 시트: '_변경감지' 시트의 체크섬 수식 / 행 수, SQLite: 리비전 번호)
+    - 지문이 바뀐 시트만 캐시에서 무효화 -> 해당 시트만 다시 로딩
+    """
+    def __init__(self, interval=30):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last_poll = 0.0
+        self._fingerprints = {}
+
+    def mark_loaded(self, store, name):
+        # 로딩 직전 지문을 기록 -> 로딩 이후에 생긴 변경은 다음 폴링에서 감지됨
+        try: self._fingerprints[name] = store.fingerprints().get(name)
+        except Exception: self._fingerprints.pop(name, None)
+
+    def mark_written(self, store, *names):
+        """
+        이 앱이 직접 쓴 뒤 지문을 다시 기록 -> 자기 쓰기를 외부 수정으로 오인해서 전체 재로딩하지 않음
+        (쓰기 직후 ~ 지문 조회 사이에 생긴 외부 수정은 놓칠 수 있음, 새로고침 버튼으로 전체 재로딩)
+        """
+        try: current = store.fingerprints()
+        except Exception:
+            for name in names: self._fingerprints.pop(name, None)
+            return
+        for name in names:
+            if name in current: self._fingerprints[name] = current[name]
+
+    def poll(self, store, cache, force=False):
+        """폴링 주기가 지났으면 지문을 비교해서 바뀐 시트만 무효화"""
+        if not force and time.time() - self._last_poll < self.interval: return []
+        if not self._lock.acquire(blocking=False): return []  # 다른 세션이 확인 중
+        try:
+            self._last_poll = time.time()
+            try: current = store.fingerprints()
+            except Exception: return []
+            changed = [
+                name for name, fp in current.items()
+                if name in self._fingerprints and self._fingerprints[name] != fp
+            ]
+            self._fingerprints.update(current)
+            if changed: cache.invalidate(*changed)
+            return changed
+        finally:
+            self._lock.release()
+
+
+# -----------------------------------------------------
+# 5. 입고 일괄 처리 로직
+# -----------------------------------------------------
+def to_int(val):
+    """'1,200' 같은 시트 값을 정수로 변환 (실패 시 0)"""
+    try: return int(str(val).replace(',', '').strip() or 0)
+    except: return 0
+
+def plan_receipt(recv_lines, df_mat):
+    """
+    recv_lines: 입고 처리할 발주 행 목록 [(시트 행번호, 자재코드, 수량, 발주ID, 화면에서 본 발주 행 8열 값), ...]
+    df_mat: 이미 불러온 자재마스터 DataFrame (자재코드 확인용)
+    return: (발주내역 셀 업데이트 목록 [(행, 열, 값), ...], 재고이력 추가 행 목록)
+    """
+    known_codes = set(df_mat['자재코드']) if '자재코드' in df_mat.columns else set()
+    ord_updates, movements = [], []
+    for row_num, mat_code, qty, order_id, _ in recv_lines:
+        ord_updates.append((row_num, ORD_STATUS_COL, "입고완료"))
+        # 자재마스터에 있는 자재만 재고 반영 (재고는 이력 추가만, 현재값을 덮어쓰지 않음)
+        if mat_code in known_codes and qty:
+            movements.append(stock_movement(mat_code, MOVE_RECEIPT, qty, order_id))
+    return ord_updates, movements
+
+ORD_ID_COL = ORD_HEADERS.index("발주ID") + 1
+ORD_CODE_COL = ORD_HEADERS.index("자재코드") + 1
+ORD_QTY_COL = ORD_HEADERS.index("수량") + 1
+
+# 발주 행이 같은 행인지 판단하는 열 (상태 제외, 수량은 '1,000' 같은 표기 차이 때문에 숫자로 비교)
+_ORD_IDENTITY_COLS = [i for i, c in enumerate(ORD_HEADERS) if c != "상태"]
+
+def _order_identity(values):
+    row = (["" if v is None else str(v).strip() for v in values] + [""] * 8)[:8]
+    return tuple(to_int(row[i]) if i == ORD_QTY_COL - 1 else row[i] for i in _ORD_IDENTITY_COLS)
+
+def _receipt_expectation(recv_lines):
+    # 화면에서 본 그대로인 행만 입고 (수량 외 모든 열이 같고 아직 '발주완료')
+    return {
+        row_num: {**{i + 1: values[i] for i in _ORD_IDENTITY_COLS if i != ORD_QTY_COL - 1}, ORD_STATUS_COL: "발주완료"}
+        for row_num, _, _, _, values in recv_lines
+    }
+
+def _relocate_receipts(storage, recv_lines):
+    """
+    충돌난 입고 행을 발주내역에서 다시 확인
+    - 원래 행번호에 같은 발주 행이 그대로 있으면 (상태만 바뀜) 이미 입고된 것이므로 건너뜀
+    - 원래 행번호의 내용이 달라졌으면 (보관 처리 / 행 삭제로 밀림) 모든 열이 같은 '발주완료' 행을 찾아서 재시도
+    return: (새 행번호로 고친 입고 행 목록, 이미 입고됐거나 사라진 행 목록)
+    """
+    current, open_rows = {}, {}
+    for row_no, row in storage.read_rows_from(ORD_SHEET, 2):
+        identity = current[row_no] = _order_identity(row)
+        if str((list(row) + [""] * 8)[ORD_STATUS_COL - 1]).strip() == "발주완료":
+            open_rows.setdefault(identity, []).append(row_no)
+    retry, gone = [], []
+    for line in recv_lines:
+        row_num, identity = line[0], _order_identity(line[4])
+        if current.get(row_num) == identity:
+            gone.append(line)
+            continue
+        candidates = open_rows.get(identity)
+        if candidates: retry.append((candidates.pop(0), *line[1:]))
+        else: gone.append(line)
+    return retry, gone
+
+def receive_orders(storage, recv_lines, df_mat, cache=None, order_log=None, max_retries=3, append_rows=None):
+    """
+    발주내역 상태 조건부 일괄 업데이트 + 재고이력 일괄 추가 1회
+    - 행마다 기대값(발주ID/자재코드/'발주완료')을 함께 보내서, 그 사이 다른 사용자가 바꾼 행은 반영하지 않음
+    - 충돌난 행만 다시 찾아서 재시도 (전체 재로딩 / 전역 잠금 없음)
+    - append_rows(시트, 행): 재고이력 추가 함수 (쓰기 큐의 append_rows 를 넘기면 상태 변경 뒤 추가가
+      실패해도 큐에 남아 재시도됨, 기본값은 storage.append_rows 직접 호출)
+    return: (입고 처리된 건수, 이미 입고됐거나 찾을 수 없어 건너뛴 행 목록)
+    """
+    received, skipped, conflicted = [], [], False
+    pending_lines = list(recv_lines)
+    try:
+        for attempt in range(max_retries + 1):
+            if not pending_lines: break
+            ord_updates, _ = plan_receipt(pending_lines, df_mat)
+            conflicts = storage.update_cells_if(ORD_SHEET, ord_updates, _receipt_expectation(pending_lines))
+            received.extend(line for line in pending_lines if line[0] not in conflicts)
+            pending_lines = [line for line in pending_lines if line[0] in conflicts]
+            if not pending_lines: break
+            conflicted = True
+            if attempt == max_retries: break
+            pending_lines, gone = _relocate_receipts(storage, pending_lines)
+            skipped.extend(gone)
+        skipped.extend(pending_lines)
+
+        if order_log is not None:
+            # 충돌이 있었으면 행 번호가 바뀌었을 수 있으므로 증분 상태를 버리고 다시 읽음
+            if conflicted: order_log.reset()
+            else: order_log.close_rows([line[0] for line in received])
+        _, movements = plan_receipt(received, df_mat)
+        (append_rows or storage.append_rows)(LEDGER_SHEET, movements)
+    finally:
+        if cache is not None: cache.invalidate(ORD_SHEET, LEDGER_SHEET)
+    return len(received), skipped
+
+# -----------------------------------------------------
+# 6. 생산계획 소요량 계산 (MRP)
+# -----------------------------------------------------
+PLAN_COLUMNS = ["설비", "용량", "방폭", "재질", "대수"]
+
+def explode_plan(df_mat, index, plan, pending=None, stock=None):
+    """
+    생산계획 -> 자재코드별 순소요량
+    df_mat: 자재마스터 DataFrame (index 와 같은 버전)
+    index: 자재마스터로 만든 ApplicabilityIndex
+    plan: [{'설비', '용량', '방폭', '재질', '대수'}, ...] (설비 1대당 매칭 자재 1개씩 필요)
+    pending: 입고 대기('발주완료') 발주 DataFrame - 이미 발주한 수량은 차감
+    stock: {자재코드: 현재재고} (재고 원장 값, 없으면 자재마스터 '현재재고' 열)
+    return: 자재코드별 소요량 / 현재재고 / 발주잔량 / 순소요량 DataFrame (순소요량 내림차순)
+    """
+    # 같은 사양은 대수를 합쳐서 사양당 1회만 매칭
+    units_by_config = {}
+    for row in plan:
+        units = to_int(row.get('대수', 0))
+        if units <= 0 or not str(row.get('설비', '')).strip(): continue
+        key = (str(row['설비']).strip(), str(row.get('용량', '')).strip(), str(row.get('방폭', '')), str(row.get('재질', '')))
+        units_by_config[key] = units_by_config.get(key, 0) + units
+
+    required = np.zeros(len(df_mat), dtype=np.int64)
+    for (equip, capa, explo, mat), units in units_by_config.items():
+        positions = index.match({"equip": equip, "capa": capa, "explo": explo, "mat": mat})
+        required[positions] += units
+
+    cols = ["자재코드", "매입처", "품명", "규격"]
+    hit = np.flatnonzero(required)
+    if len(hit) == 0 or any(c not in df_mat.columns for c in cols):
+        return pd.DataFrame(columns=cols + ["소요량", "현재재고", "발주잔량", "순소요량"])
+
+    stock_col = df_mat.columns[MAT_STOCK_COL - 1] if len(df_mat.columns) >= MAT_STOCK_COL else None
+    frame = df_mat.iloc[hit][cols].astype(str).copy()
+    frame["소요량"] = required[hit]
+    frame["현재재고"] = df_mat.iloc[hit][stock_col].to_numpy() if stock_col is not None else 0
+    # 같은 자재코드가 여러 행이면 소요량은 합산, 재고는 첫 행 기준
+    result = frame.groupby("자재코드", sort=False).agg(
+        {"매입처": "first", "품명": "first", "규격": "first", "소요량": "sum", "현재재고": "first"}).reset_index()
+
+    open_qty = {}
+    if pending is not None and not pending.empty:
+        open_qty = pending.groupby('자재코드')['수량'].sum().to_dict()
+    if stock is not None: result["현재재고"] = result["자재코드"].map(stock).fillna(0).astype(np.int64)
+    result["발주잔량"] = result["자재코드"].map(open_qty).fillna(0).astype(np.int64)
+    result["순소요량"] = (result["소요량"] - result["현재재고"] - result["발주잔량"]).clip(lower=0)
+    return result.sort_values(["순소요량", "매입처"], ascending=[False, True], kind="stable").reset_index(drop=True)
+
+def plan_to_cart(result, note="생산계획"):
+    """순소요량이 남은 자재만 장바구니 항목으로 (거래처별 발주서는 장바구니에서 거래처 단위로 생성)"""
+    need = result[result["순소요량"] > 0]
+    return [
+        {'code': r['자재코드'], 'name': r['품명'], 'spec': r['규격'], 'qty': int(r['순소요량']),
+         'supplier': r['매입처'], 'note': note, 'is_new': False}
+        for r in need.to_dict('records')
+    ]
+
+# -----------------------------------------------------
+# 7. 자재마스터 일괄 등록
+# -----------------------------------------------------
+def plan_material_import(df_in, df_mat, allocator, pending_rows=()):
+    """
+    df_in: 업로드한 표 (필수: 매입처, 품명 / 선택: 규격, 적용설비, 단가, 현재재고, 비고, 자재코드)
+    df_mat: 현재 자재마스터
+    pending_rows: 쓰기 큐에 대기 중인 자재마스터 행 (아직 df_mat 에 없지만 등록된 것으로 봄)
+    return: (자재마스터에 추가할 행 목록, 제외된 행 DataFrame ['사유' 열 포함])
+    """
+    missing = [c for c in ("매입처", "품명") if c not in df_in.columns]
+    if missing: raise ValueError(f"필수 열이 없습니다: {', '.join(missing)}")
+
+    rows = pd.DataFrame(index=df_in.index)
+    for col in MAT_HEADERS:
+        src = df_in[col] if col in df_in.columns else pd.Series("", index=df_in.index)
+        rows[col] = src.where(src.notna(), "").astype(str).str.strip()
+    for col in INT_COLUMNS[MAT_SHEET]:
+        rows[col] = parse_int_column(rows[col])
+
+    keys = list(zip(rows['매입처'], rows['품명'], rows['규격']))
+    key_cols = ("매입처", "품명", "규격")
+    existing_keys = set()
+    if all(c in df_mat.columns for c in key_cols):
+        existing_keys = set(zip(df_mat['매입처'].astype(str).str.strip(), df_mat['품명'].astype(str), df_mat['규격'].astype(str)))
+    pending = [(list(r) + [""] * len(MAT_HEADERS))[:len(MAT_HEADERS)] for r in pending_rows]
+    existing_keys |= {(str(r[5]).strip(), str(r[1]), str(r[2])) for r in pending}
+
+    reason = pd.Series("", index=rows.index)
+    reason[(rows['매입처'] == "") | (rows['품명'] == "")] = "매입처/품명 누락"
+    reason[(reason == "") & pd.Series([k in existing_keys for k in keys], index=rows.index)] = "이미 등록됨"
+    reason[(reason == "") & pd.Series(keys, index=rows.index).duplicated()] = "파일 내 중복"
+    new = rows[reason == ""].copy()
+
+    # 자재코드: 지정한 코드가 비어 있거나 이미 쓰이는 코드면 스마트코드 + 일련번호로 발급
+    existing_codes = set(df_mat['자재코드'].astype(str)) if '자재코드' in df_mat.columns else set()
+    existing_codes |= {str(r[0]) for r in pending}
+    given = new['자재코드']
+    need_code = (given == "") | given.isin(existing_codes) | given.duplicated()
+    if need_code.any():
+        sub = new[need_code]
+        bases = smart_code_bases(sub['매입처'], sub['품명'], sub['규격'])
+        new.loc[need_code, '자재코드'] = allocator.allocate(bases, existing_codes | set(given[~need_code]))
+
+    skipped = df_in.loc[reason != ""].assign(사유=reason[reason != ""])
+    return [[v.item() if hasattr(v, 'item') else v for v in r] for r in new[MAT_HEADERS].itertuples(index=False)], skipped
+
+# -----------------------------------------------------
+# 8. 장바구니 일괄 가져오기 / 발주 행 생성
+# -----------------------------------------------------
+def match_cart_lines(df_in, df_mat):
+    """
+    df_in: 업로드한 발주 목록 (자재코드 또는 품명+규격, 수량, 비고 / 선택: 매입처)
+    자재마스터와 한 번의 조인으로 매칭 (자재코드 우선, 없으면 [매입처+]품명+규격의 첫 행)
+    return: (장바구니 항목 목록, 매칭 실패 행 DataFrame)
+    """
+    if '자재코드' not in df_in.columns and '품명' not in df_in.columns:
+        raise ValueError("자재코드 또는 품명 열이 필요합니다.")
+    lines = pd.DataFrame(index=df_in.index)
+    for col in ("자재코드", "매입처", "품명", "규격", "비고"):
+        src = df_in[col] if col in df_in.columns else pd.Series("", index=df_in.index)
+        lines[col] = src.where(src.notna(), "").astype(str).str.strip()
+    lines['수량'] = parse_int_column(df_in['수량']) if '수량' in df_in.columns else 1
+    lines['_line'] = range(len(lines))
+
+    master = pd.DataFrame({c: df_mat[c].astype(str) for c in ("자재코드", "매입처", "품명", "규격") if c in df_mat.columns})
+    if len(master.columns) < 4:
+        raise ValueError("자재마스터에 자재코드/매입처/품명/규격 열이 필요합니다.")
+    master['매입처'] = master['매입처'].str.strip()
+
+    by_code = lines[lines['자재코드'] != ""].merge(
+        master.drop_duplicates('자재코드'), on='자재코드', how='inner', suffixes=('_in', ''))
+    rest = lines[~lines['_line'].isin(by_code['_line'])]
+    with_sup = rest[rest['매입처'] != ""].merge(
+        master.drop_duplicates(['매입처', '품명', '규격']), on=['매입처', '품명', '규격'], how='inner', suffixes=('_in', ''))
+    rest = rest[~rest['_line'].isin(with_sup['_line'])]
+    by_name = rest.drop(columns='매입처').merge(
+        master.drop_duplicates(['품명', '규격']), on=['품명', '규격'], how='inner', suffixes=('_in', ''))
+
+    matched = pd.concat([by_code, with_sup, by_name], ignore_index=True).sort_values('_line')
+    matched = matched[matched['수량'] > 0]
+    items = [
+        {'code': r['자재코드'], 'name': r['품명'], 'spec': r['규격'], 'qty': int(r['수량']),
+         'supplier': r['매입처'], 'note': r['비고'], 'is_new': False}
+        for r in matched.to_dict('records')
+    ]
+    unmatched = df_in[~lines['_line'].isin(matched['_line']).to_numpy()]
+    return items, unmatched
+
+class Cart:
+    """
+    세션별 장바구니 - 거래처별로 묶어서 보관 {거래처: {(자재코드, 품명, 규격, 비고, 신규여부): 수량}}
+    - 같은 거래처 / 자재 / 비고 를 다시 담으면 수량만 합산 (행 dict 를 쌓지 않음)
+    - 거래처별 발주서 / 확정 시 전체 목록을 다시 거르지 않음, 화면 표는 필요할 때만 만듦
+    """
+    COLUMNS = ['supplier', 'name', 'spec', 'qty', 'note', 'code']
+
+    def __init__(self):
+        self.lines = {}
+
+    def add(self, items):
+        """장바구니 항목 dict 목록 ({'code', 'name', 'spec', 'qty', 'supplier', 'note', 'is_new'}) 추가"""
+        for item in items:
+            key = (str(item['code']), str(item['name']), str(item['spec']), str(item.get('note', '')), bool(item.get('is_new')))
+            group = self.lines.setdefault(str(item['supplier']), {})
+            group[key] = group.get(key, 0) + int(item['qty'])
+
+    def suppliers(self):
+        return list(self.lines)
+
+    def items(self, supplier):
+        """거래처 1곳의 항목 dict 목록 (발주서 / 발주 행 생성용)"""
+        return [
+            {'code': code, 'name': name, 'spec': spec, 'qty': qty, 'supplier': supplier, 'note': note, 'is_new': is_new}
+            for (code, name, spec, note, is_new), qty in self.lines.get(supplier, {}).items()
+        ]
+
+    def by_supplier(self):
+        return {sup: self.items(sup) for sup in self.lines}
+
+    def remove(self, supplier):
+        self.lines.pop(supplier, None)
+
+    def clear(self):
+        self.lines.clear()
+
+    def __len__(self):
+        return sum(len(group) for group in self.lines.values())
+
+    def frame(self):
+        rows = [[item[c] for c in self.COLUMNS] for sup in self.lines for item in self.items(sup)]
+        return pd.DataFrame(rows, columns=self.COLUMNS)
+
+def build_order_rows(cart_items, order_id, date_str):
+    """장바구니 항목 -> 발주내역 행 목록 (상태 '발주완료')"""
+    return [
+        [order_id, date_str, item['supplier'], item['name'], item['qty'], "발주완료", item['note'], item['code']]
+        for item in cart_items
+    ]
+
+# -----------------------------------------------------
+# 9. 견적 단가 자동 산출
+# -----------------------------------------------------
+_HP_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(?:HP|마력)', re.I)
+
+def parse_hp(text):
+    """'30HP' / '7.5 마력' -> 30.0 / 7.5 (마력 표기가 없으면 None)"""
+    m = _HP_PATTERN.search(str(text))
+    return float(m.group(1)) if m else None
+
+class QuotePricer:
+    """
+    자재마스터 단가로 견적 BOM 을 채우는 조회기 (자재마스터 버전별 1개)
+    - 모터: 품명에 '모터' + 마력(HP), 적용설비가 사양에 맞는 행 우선, 없으면 적용설비가 빈 행
+      (다른 설비/방폭용으로 지정된 모터는 쓰지 않음 -> 단가 미정)
+    - 본체 / 전장반: 적용설비 매칭 행 중 품명 키워드로 선택 (전장반은 방폭 표기 행도 후보)
+    - 사양 조합별 단가표는 처음 요청될 때 한 번만 만들어 메모이즈
+    """
+    BODY_KEYWORDS = ("본체", "베셀", "VESSEL", "BODY", "제관")
+    PANEL_KEYWORDS = ("판넬", "패널", "PANEL", "제어반", "전장")
+
+    def __init__(self, df_mat, index):
+        self._index = index
+        self._memo = {}
+        self._lock = threading.Lock()
+        cols = [c for c in ('자재코드', '품명', '규격', '단가', '적용설비') if c in df_mat.columns]
+        self._rows = df_mat[cols].astype({c: str for c in cols if c != '단가'}).to_dict('records')
+        self._motors = {}
+        self._body, self._panel = set(), set()
+        for pos, rec in enumerate(self._rows):
+            name = rec.get('품명', '').upper()
+            if to_int(rec.get('단가', 0)) <= 0: continue
+            if '모터' in name:
+                hp = parse_hp(f"{rec.get('규격', '')} {name}")
+                if hp is not None: self._motors.setdefault(hp, []).append(pos)
+            elif any(k in name for k in self.BODY_KEYWORDS): self._body.add(pos)
+            elif any(k in name for k in self.PANEL_KEYWORDS): self._panel.add(pos)
+
+    def _pick(self, positions, source):
+        """첫 후보 행 -> (단가, 비고)"""
+        rec = self._rows[positions[0]]
+        return to_int(rec.get('단가', 0)), f"{source}: {rec.get('자재코드', '')}"
+
+    def _table(self, selection):
+        key = (selection['equip'], str(selection['capa']), selection['explo'], selection['mat'])
+        with self._lock:
+            if key in self._memo: return self._memo[key]
+        matched = set(self._index.match(selection))
+        options = {o.upper() for o in build_option_keywords(selection['explo'], selection['mat'])}
+        table = {'motor': {}, 'body': None, 'panel': None}
+        for hp, positions in self._motors.items():
+            fit = [p for p in positions if p in matched]
+            generic = [p for p in positions if not self._rows[p].get('적용설비', '').strip()]
+            if fit: table['motor'][hp] = self._pick(fit, "자재마스터")
+            elif generic: table['motor'][hp] = self._pick(generic, "자재마스터(적용설비 미지정)")
+        body = sorted(self._body & matched)
+        if body: table['body'] = self._pick(body, "자재마스터")
+        panel = sorted(self._panel & matched)
+        if not panel:
+            # 적용설비가 비어 있어도 품명/규격에 방폭 표기(비방폭 / EG3 / d2G4)가 있으면 후보
+            explo = [o for o in options if o in ("비방폭", "EG3", "D2G4")]
+            panel = [p for p in sorted(self._panel)
+                     if any(o in f"{self._rows[p].get('품명', '')} {self._rows[p].get('규격', '')}".upper() for o in explo)]
+        if panel: table['panel'] = self._pick(panel, "자재마스터")
+        with self._lock:
+            self._memo[key] = table
+        return table
+
+    def price(self, quote):
+        """
+        quote: 견적 화면 입력값 {'설비', '용량', '메인', '서브', '방폭', '재질'}
+        return: {'main', 'sub', 'body', 'panel'} -> (단가, 비고) 또는 None (자재마스터에 없음)
+        """
+        table = self._table({"equip": quote['설비'], "capa": quote['용량'], "explo": quote['방폭'], "mat": quote['재질']})
+        result = {'body': table['body'], 'panel': table['panel']}
+        for line, col in (('main', '메인'), ('sub', '서브')):
+            hp = parse_hp(quote[col])
+            result[line] = table['motor'].get(hp) if hp is not None else None
+        return result
+
+def build_quote_bom(quote, prices, fallback=None):
+    """
+    견적 기본 BOM (자재마스터 단가 반영)
+    fallback: (견적ID, 총액) - 자재마스터로 단가를 하나도 못 찾으면 같은 사양 최근 견적 총액을 한 줄로
+    """
+    def line(name, spec, price, note):
+        unit, source = price if price else (0, note)
+        return {"항목": name, "규격": spec, "단가": unit, "수량": 1, "비고": source}
+
+    bom = [
+        line("Main Motor", quote['메인'], prices.get('main'), "자동선택"),
+        line("Sub Motor", quote['서브'], prices.get('sub'), "자동선택"),
+        line("Body Vessel (가공/제관)", f"{quote['용량']} ({quote['재질']})", prices.get('body'), "본체 및 프레임"),
+        line("Control Panel (전장)", quote['방폭'], prices.get('panel'), "인버터 포함"),
+        line("기타 자재 (배관/볼트)", "-", None, "소모 자재 일체"),
+        line("노무비 및 경비", "-", None, "조립/시운전"),
+        line("이윤 및 기업관리비", "-", None, ""),
+    ]
+    if fallback and not any(prices.values()):
+        quote_id, total = fallback
+        bom.insert(0, {"항목": "이전 견적 기준 금액", "규격": quote_id, "단가": total, "수량": 1, "비고": "견적DB 최근 동일 사양"})
+    return bom
+
+# -----------------------------------------------------
+# 10. 유사 견적 색인 (견적DB)
+# -----------------------------------------------------
+QUOTE_SPEC_COLUMNS = ["설비", "용량", "방폭", "재질"]
+
+def quote_spec(quote):
+    """유사 견적 그룹 키 (설비, 용량, 방폭, 재질) - 견적DB 저장 값 그대로 비교"""
+    return tuple(str(quote.get(c, '')).strip() for c in QUOTE_SPEC_COLUMNS)
+
+class QuoteIndex:
+    """
+    견적DB 는 뒤로 추가만 되므로 마지막으로 읽은 행 이후만 조회해서 사양별 목록에 추가 (증분)
+    - (설비, 용량, 방폭, 재질) -> [(행번호, 메인HP, 서브HP, 견적 값 dict), ...] (시트 순서 = 오래된 순)
+    - 조회 비용은 전체 견적 수가 아니라 같은 사양 견적 수에 비례
+    시트에서 직접 수정/삭제되면 reset() 후 전체 재로딩
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.last_row = 1     # 마지막으로 읽은 행 (1 = 헤더)
+        self._groups = {}
+
+    def refresh(self, storage):
+        """새로 추가된 행만 읽어서 색인 갱신"""
+        with self._lock:
+            for row_no, row in storage.read_rows_from(QUOTE_SHEET, self.last_row + 1):
+                row = ["" if v is None else str(v) for v in row]
+                rec = dict(zip(QUOTE_HEADERS, (row + [""] * len(QUOTE_HEADERS))[:len(QUOTE_HEADERS)]))
+                if rec['설비'].strip():
+                    rec['총액'] = to_int(rec['총액'])
+                    entry = (row_no, parse_hp(rec['메인']) or 0.0, parse_hp(rec['서브']) or 0.0, rec)
+                    self._groups.setdefault(quote_spec(rec), []).append(entry)
+                self.last_row = max(self.last_row, row_no)
+
+    def __len__(self):
+        return sum(len(g) for g in self._groups.values())
+
+    def similar(self, quote, limit=5):
+        """
+        같은 사양 견적 중 메인/서브 마력 차이가 작은 순 (같으면 최근 견적 우선) 최대 limit 건
+        return: [견적 값 dict + '마력차'] (마력 표기가 없으면 0HP 로 비교)
+        """
+        main_hp, sub_hp = parse_hp(quote.get('메인', '')) or 0.0, parse_hp(quote.get('서브', '')) or 0.0
+        with self._lock:
+            group = list(self._groups.get(quote_spec(quote), ()))
+        nearest = heapq.nsmallest(limit, group, key=lambda e: (abs(e[1] - main_hp) + abs(e[2] - sub_hp), -e[0]))
+        return [{**e[3], '마력차': abs(e[1] - main_hp) + abs(e[2] - sub_hp)} for e in nearest]
+
+    def latest(self, quote):
+        """메인/서브 마력까지 같은 가장 최근 견적의 (견적ID, 총액) 또는 None"""
+        main_hp, sub_hp = parse_hp(quote.get('메인', '')) or 0.0, parse_hp(quote.get('서브', '')) or 0.0
+        with self._lock:
+            group = list(self._groups.get(quote_spec(quote), ()))
+        for _, main, sub, rec in reversed(group):
+            if main == main_hp and sub == sub_hp and rec['총액'] > 0: return rec['견적ID'], rec['총액']
+        return None
+
+# -----------------------------------------------------
+# 11. 영업/구매 분석 (증분 집계)
+# -----------------------------------------------------
+class Analytics:
+    """
+    시트별로 마지막으로 읽은 행 이후만 읽어서 집계값에 더함 (전체 시트 재집계 없음)
+    - 견적DB: (설비, 월) -> [견적 건수, 총액 합계]
+    - 발주내역 / 발주보관: (거래처, 자재코드, 품명) -> [발주 건수, 수량 합계] (시트별로 따로 보관)
+    - 재고이력 '입고' 행: 자재코드 -> [입고 건수, 리드타임 합계(일), 최대(일)] (발주ID 의 발주 시각 기준)
+    발주내역은 보관 처리 시 행이 삭제되므로 reset(ORD_SHEET) 후 그 시트만 다시 집계
+    """
+    SHEETS = (QUOTE_SHEET, ORD_SHEET, ARCHIVE_SHEET, LEDGER_SHEET)
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._last_row, self._tallies = {}, {}
+        self._synced = {}     # 시트명 -> 마지막으로 반영한 원본 캐시 버전
+        self.reset()
+
+    def reset(self, *names):
+        """지정한 시트 (없으면 전체) 의 집계를 버림 -> 다음 refresh 에서 그 시트만 처음부터"""
+        with self._lock:
+            for name in names or self.SHEETS:
+                self._last_row[name] = 1
+                self._tallies[name] = {}
+                self._synced.pop(name, None)
+
+    def sync(self, storage, versions):
+        """versions: {시트명: 캐시 버전} - 지난번 반영 이후 버전이 바뀐 시트만 refresh"""
+        with self._lock:
+            changed = [name for name, version in versions.items() if self._synced.get(name) != version]
+            if changed: self.refresh(storage, *changed)
+            self._synced.update({name: versions[name] for name in changed})
+
+    def refresh(self, storage, *names):
+        """새로 추가된 행만 읽어서 집계 갱신"""
+        with self._lock:
+            for name in names or self.SHEETS:
+                tally = self._tallies[name]
+                for row_no, row in storage.read_rows_from(name, self._last_row[name] + 1):
+                    row = ["" if v is None else str(v).strip() for v in row]
+                    if name == QUOTE_SHEET: self._add_quote(tally, row)
+                    elif name == LEDGER_SHEET: self._add_receipt(tally, row)
+                    else: self._add_order(tally, row)
+                    self._last_row[name] = max(self._last_row[name], row_no)
+
+    @staticmethod
+    def _add_quote(tally, row):
+        row = (row + [""] * len(QUOTE_HEADERS))[:len(QUOTE_HEADERS)]
+        equip, date = row[QUOTE_HEADERS.index("설비")], row[QUOTE_HEADERS.index("날짜")]
+        if not equip: return
+        acc = tally.setdefault((equip, date[:7] or "-"), [0, 0])
+        acc[0] += 1
+        acc[1] += to_int(row[QUOTE_HEADERS.index("총액")])
+
+    @staticmethod
+    def _add_order(tally, row):
+        row = (row + [""] * 8)[:8]
+        supplier, name, code = row[2], row[3], row[ORD_CODE_COL - 1]
+        if not supplier and not code: return
+        acc = tally.setdefault((supplier, code, name), [0, 0])
+        acc[0] += 1
+        acc[1] += to_int(row[ORD_QTY_COL - 1])
+
+    @staticmethod
+    def _add_receipt(tally, row):
+        row = (row + [""] * 6)[:6]
+        if row[2] != MOVE_RECEIPT or not row[1]: return
+        try:
+            received = datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S")
+            ordered = datetime.strptime(row[4], "%y%m%d%H%M")
+        except ValueError: return  # 발주ID 가 없는 입고 (직접 기록 등) 는 리드타임 제외
+        days = max((received - ordered).total_seconds() / 86400, 0.0)
+        acc = tally.setdefault(row[1], [0, 0.0, 0.0])
+        acc[0] += 1
+        acc[1] += days
+        acc[2] = max(acc[2], days)
+
+    def quote_frame(self):
+        """설비 / 월별 견적 건수와 총액"""
+        with self._lock:
+            items = list(self._tallies[QUOTE_SHEET].items())
+        frame = pd.DataFrame([(e, m, n, total) for (e, m), (n, total) in items], columns=["설비", "월", "견적건수", "견적총액"])
+        return frame.sort_values(["월", "설비"], ascending=[False, True], ignore_index=True)
+
+    def purchase_frame(self):
+        """거래처 / 자재코드별 발주 건수와 수량 (발주내역 + 발주보관)"""
+        merged = {}
+        with self._lock:
+            for name in (ORD_SHEET, ARCHIVE_SHEET):
+                for key, (n, qty) in self._tallies[name].items():
+                    acc = merged.setdefault(key, [0, 0])
+                    acc[0] += n
+                    acc[1] += qty
+        frame = pd.DataFrame([(*key, n, qty) for key, (n, qty) in merged.items()],
+                             columns=["거래처", "자재코드", "품명", "발주건수", "발주수량"])
+        return frame.sort_values(["발주수량", "거래처"], ascending=[False, True], ignore_index=True)
+
+    def lead_time_frame(self):
+        """자재코드별 발주 -> 입고 리드타임 (일)"""
+        with self._lock:
+            items = list(self._tallies[LEDGER_SHEET].items())
+        frame = pd.DataFrame([(code, n, total / n, peak) for code, (n, total, peak) in items],
+                             columns=["자재코드", "입고건수", "평균리드타임(일)", "최대리드타임(일)"])
+        return frame.sort_values("평균리드타임(일)", ascending=False, ignore_index=True).round(1)
+
+# -----------------------------------------------------
+# 12. 발주점 / 재고 부족 판정 (증분)
+# -----------------------------------------------------
+class ReorderEngine:
+    """
+    발주점 이하 자재 집합을 바뀐 자재코드만 다시 판정해서 유지 (자재마스터 전체 재검사 없음)
+    - 판정: 가용재고 (재고 원장 재고 + 입고 대기 수량) <= 발주점
+    - 재고 원장 / 발주 색인의 take_changed() 로 입고 / 발주 확정 / 재고 변동이 있었던 자재만 판정
+    - 발주점 시트가 다시 로딩되면 발주점이 바뀐 자재만 판정
+    - 발주 제안 수량: 발주량 (없으면 발주점 x 2 까지 채우는 수량)
+    """
+    def __init__(self, ledger, order_log):
+        self._ledger, self._orders = ledger, order_log
+        self._lock = threading.Lock()
+        self._points = {}            # 자재코드 -> (발주점, 발주량)
+        self._points_version = None
+        self.low = {}                # 자재코드 -> (가용재고, 발주점, 발주 제안 수량)
+
+    def _evaluate(self, code):
+        policy = self._points.get(code)
+        if policy is None: return self.low.pop(code, None)
+        point, lot = policy
+        position = self._ledger.stock_of(code) + self._orders.open_qty.get(code, 0)
+        if position <= point: self.low[code] = (position, point, lot if lot > 0 else max(2 * point - position, 1))
+        else: self.low.pop(code, None)
+
+    def sync(self, points, version):
+        """
+        points: 발주점 시트 DataFrame (같은 자재코드는 아래 행이 우선), version: 그 캐시 버전
+        return: 다시 판정한 자재 수
+        """
+        with self._lock:
+            codes = set()
+            if version != self._points_version:
+                new_points = {}
+                if {'자재코드', '발주점'} <= set(points.columns):
+                    lots = points['발주량'] if '발주량' in points.columns else pd.Series(0, index=points.index)
+                    for code, point, lot in zip(points['자재코드'].astype(str).str.strip(), points['발주점'], lots):
+                        if not code: continue
+                        if point > 0: new_points[code] = (int(point), int(lot))
+                        else: new_points.pop(code, None)  # 발주점 0 = 관리 해제
+                codes = {c for c in set(self._points) | set(new_points) if self._points.get(c) != new_points.get(c)}
+                self._points, self._points_version = new_points, version
+            for changed in (self._ledger.take_changed(), self._orders.take_changed()):
+                codes |= set(self._points) if changed is None else changed
+            for code in codes: self._evaluate(code)
+            return len(codes)
+
+    def low_frame(self, code_rows):
+        """code_rows: {자재코드: (매입처, 품명, 규격)} -> 재고 부족 자재 DataFrame (매입처 순)"""
+        with self._lock:
+            low = list(self.low.items())
+        rows = [(*code_rows.get(code, ("", "", "")), code, position, point, qty) for code, (position, point, qty) in low]
+        frame = pd.DataFrame(rows, columns=["매입처", "품명", "규격", "자재코드", "가용재고", "발주점", "발주수량"])
+        return frame.sort_values(["매입처", "자재코드"], ignore_index=True)
+
+def reorder_point_row(mat_code, point, lot=0):
+    """발주점 시트 1행 (발주점 0 이면 관리 해제)"""
+    return [str(mat_code), int(point), int(lot), time.strftime("%Y-%m-%d %H:%M:%S")]
+
+def reorder_to_cart(low, note="발주점 보충"):
+    """재고 부족 자재 -> 장바구니 항목 (거래처별 발주서는 장바구니에서 거래처 단위로 생성)"""
+    return [
+        {'code': r['자재코드'], 'name': r['품명'], 'spec': r['규격'], 'qty': int(r['발주수량']),
+         'supplier': r['매입처'], 'note': note, 'is_new': False}
+        for r in low.to_dict('records') if r['매입처']
+    ]
+
+# -----------------------------------------------------
+# 13. 대용량 표 서버 쪽 필터
+# -----------------------------------------------------
+def filter_frame(df, isin=None, date_col=None, date_range=None, prefix=None, text="", text_cols=()):
+    """
+    브라우저로 보내기 전에 서버에서 행을 거름 (빈 조건은 무시)
+    isin: {열: 허용값 목록}, date_range: (시작, 끝) 'YYYY-MM-DD' 비교 (양 끝 포함)
+    prefix: {열: 접두어} (발주ID 등), text: text_cols 중 하나라도 포함 (대소문자 무시)
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for col, values in (isin or {}).items():
+        if values and col in df.columns: mask &= df[col].astype(str).isin([str(v) for v in values]).to_numpy()
+    if date_col in df.columns and date_range:
+        dates = df[date_col].astype(str).str[:10]
+        start, end = (list(date_range) + [None, None])[:2]
+        if start: mask &= (dates >= str(start)).to_numpy()
+        if end: mask &= (dates <= str(end)).to_numpy()
+    for col, head in (prefix or {}).items():
+        head = str(head).strip()
+        if head and col in df.columns: mask &= df[col].astype(str).str.startswith(head).to_numpy()
+    text = str(text).strip()
+    if text:
+        hit = np.zeros(len(df), dtype=bool)
+        for col in text_cols:
+            if col in df.columns: hit |= df[col].astype(str).str.contains(text, case=False, regex=False).to_numpy()
+        mask &= hit
+    return df[mask]
@@ -0,0 +1,159 @@
+"""
+발주서 PDF 생성
+- 파일을 거치지 않고 메모리(bytes)로 바로 생성
+- 한글 폰트는 프로세스당 1회 확인/다운로드, 문서당 1회만 등록 (페이지마다 등록하지 않음)
+- 여러 거래처 발주서는 프로세스 풀에서 병렬로 만들어 ZIP 1개로 반환
+"""
+import io
+import multiprocessing
+import os
+import threading
+import urllib.request
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from fpdf import FPDF
+
+FONT_FILE = "NanumGothic.ttf"
+FONT_URL = "https://github.com/google/fonts/raw/main/ofl/nanumgothic/NanumGothic-Regular.ttf"
+FONT_FAMILY = "NanumGothic"
+
+_font_ready = False
+
+def ensure_font_exists():
+    global _font_ready
+    if _font_ready: return True
+    if not os.path.exists(FONT_FILE):
+        try:
+            # 다른 프로세스가 반쯤 받은 파일을 읽지 않도록 임시 파일로 받은 뒤 교체
+            tmp_file = f"{FONT_FILE}.{os.getpid()}.part"
+            urllib.request.urlretrieve(FONT_URL, tmp_file)
+            os.replace(tmp_file, FONT_FILE)
+        except Exception: return False
+    _font_ready = True
+    return True
+
+# -----------------------------------------------------
+# PDF 생성 클래스
+# -----------------------------------------------------
+class PDF(FPDF):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 폰트는 문서당 1회 등록 (fpdf2 는 출력 시 폰트 객체를 서브셋팅하면서 변경하므로 문서 간 공유 불가)
+        self.base_font = "Arial"
+        if ensure_font_exists():
+            self.add_font(FONT_FAMILY, "", FONT_FILE)
+            self.base_font = FONT_FAMILY
+
+    def header(self):
+        self.set_font(self.base_font, "", 10)
+        self.set_font_size(24)
+        try: self.cell(0, 15, "발    주    서", align="C", ln=True)
+        except: self.cell(0, 15, "ORDER SHEET", align="C", ln=True)
+        self.ln(5)
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font(self.base_font, "", 8)
+        self.cell(0, 10, f'Page {self.page_no()}', align="C")
+
+def order_pdf_filename(supplier_name):
+    return f"발주서_{supplier_name}_{datetime.now().strftime('%y%m%d')}.pdf"
+
+def render_order_pdf(supplier_info, order_items):
+    """발주서 PDF 를 bytes 로 반환 (폰트 준비 실패 시 None)"""
+    if not ensure_font_exists(): return None
+    pdf = PDF()
+    pdf.add_page()
+    pdf.set_font(FONT_FAMILY, "", 11)
+
+    # 상단 정보
+    pdf.set_fill_color(240, 240, 240)
+    pdf.cell(30, 10, "  발  신  인", border=1, fill=True)
+    pdf.cell(160, 10, "  베스트화학기계공업(주)   (담당: 김송이 과장)", border=1, ln=True)
+    pdf.cell(30, 10, "  수  신  인", border=1, fill=True)
+    pdf.cell(60, 10, f"  {supplier_info['name']}", border=1)
+    pdf.cell(30, 10, "  F    A    X", border=1, fill=True)
+    pdf.cell(70, 10, f"  {supplier_info.get('fax', '')}", border=1, ln=True)
+    pdf.cell(30, 10, "  발  주  일", border=1, fill=True)
+    pdf.cell(160, 10, f"  {datetime.now().strftime('%Y년 %m월 %d일')}", border=1, ln=True)
+    pdf.ln(8)
+
+    pdf.multi_cell(0, 6, "※ 베스트입니다. 다음과 같이 발주하고자 합니다.\n   오늘도 행복한 하루 보내세요. 감사합니다. ^^")
+    pdf.ln(5)
+
+    # 자재 목록
+    pdf.set_fill_color(220, 220, 220)
+    pdf.cell(15, 8, "No", border=1, align="C", fill=True)
+    pdf.cell(70, 8, "품  명", border=1, align="C", fill=True)
+    pdf.cell(50, 8, "규  격", border=1, align="C", fill=True)
+    pdf.cell(20, 8, "수 량", border=1, align="C", fill=True)
+    pdf.cell(35, 8, "비 고", border=1, align="C", fill=True, ln=True)
+
+    total_qty = 0
+    for idx, item in enumerate(order_items):
+        qty = int(item['qty'])
+        total_qty += qty
+        pdf.cell(15, 8, str(idx+1), border=1, align="C")
+        pdf.cell(70, 8, str(item['name']), border=1, align="L")
+        pdf.cell(50, 8, str(item['spec']), border=1, align="C")
+        pdf.cell(20, 8, str(qty), border=1, align="C")
+        pdf.cell(35, 8, str(item.get('note', '')), border=1, align="L", ln=True)
+
+    pdf.cell(135, 8, "합    계", border=1, align="C")
+    pdf.cell(20, 8, str(total_qty), border=1, align="C")
+    pdf.cell(35, 8, "", border=1, ln=True)
+    pdf.ln(15)
+
+    pdf.set_font_size(16)
+    pdf.cell(0, 10, "베스트화학기계공업(주)   (인)", align="R", ln=True)
+
+    return bytes(pdf.output())
+
+# -----------------------------------------------------
+# 거래처별 일괄 생성 (프로세스 풀)
+# -----------------------------------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    # 스트림릿 서버는 멀티스레드라 fork 대신 spawn, 풀은 프로세스 내에서 재사용
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=min(4, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=ensure_font_exists,
+            )
+        return _pool
+
+def _render_job(job):
+    supplier_name, items = job
+    return order_pdf_filename(supplier_name), render_order_pdf({'name': supplier_name}, items)
+
+def render_orders(carts):
+    """
+    carts: {거래처명: [품목 dict, ...]}
+    거래처별 (파일명, PDF bytes) 를 완성되는 순서대로 생성 (폰트 준비 실패 시 아무것도 생성하지 않음)
+    """
+    # 폰트 다운로드는 부모 프로세스에서 한 번만
+    if not ensure_font_exists(): return
+    jobs = [(sup, list(items)) for sup, items in carts.items()]
+    if len(jobs) == 1:
+        yield _render_job(jobs[0])
+    else:
+        yield from _get_pool().map(_render_job, jobs)
+
+def render_orders_zip(carts):
+    """
+    carts: {거래처명: [품목 dict, ...]}
+    return: 거래처별 발주서 PDF 를 담은 ZIP bytes (폰트 준비 실패 시 None)
+    """
+    if not ensure_font_exists(): return None
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for file_name, data in render_orders(carts):
+            if data: zf.writestr(file_name, data)
+    return buf.getvalue()
@@ -0,0 +1,218 @@
+"""
+할당량(quota) 인식 gspread 래퍼
+- 분당 읽기/쓰기 요청 수를 슬라이딩 윈도우로 추적, 한도를 넘기기 전에 대기
+- 429 / 5xx 응답은 지터를 섞은 지수 백오프로 재시도
+  (행 추가 / 행 삭제처럼 다시 보내면 결과가 달라지는 쓰기는 429 만 재시도, 나머지 실패는 호출자에게 넘김)
+- 동시에 들어온 같은 읽기 요청은 1회만 호출하고 결과를 호출자별 사본으로 나눠줌
+- 호출별 지연시간 / 남은 할당량 리포트
+"""
+import copy
+import random
+import threading
+import time
+from collections import deque
+
+import gspread
+import requests
+
+READ_METHODS = {
+    # Worksheet
+    "get_all_records", "get_all_values", "get", "get_values", "batch_get", "cell", "acell",
+    "find", "findall", "col_values", "row_values", "range",
+    # Spreadsheet
+    "worksheet", "worksheets", "fetch_sheet_metadata", "values_batch_get",
+    # Client
+    "open_by_url", "open_by_key", "open",
+}
+WRITE_METHODS = {
+    "append_row", "append_rows", "update", "update_cell", "update_cells", "update_acell",
+    "batch_update", "batch_clear", "clear", "resize", "add_rows", "insert_row", "insert_rows",
+    "delete_rows", "hide", "add_worksheet", "del_worksheet", "values_update", "values_append",
+}
+# 같은 값을 다시 써도 결과가 같은 쓰기 (응답이 유실돼도 재시도 가능)
+OVERWRITE_METHODS = {
+    "update", "update_cell", "update_cells", "update_acell", "batch_clear", "clear", "resize", "hide", "values_update",
+}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+QUOTA_STATUS = 429  # 서버가 실행하기 전에 거절 -> 어떤 요청이든 재시도 가능
+
+
+class QuotaBudget:
+    """최근 window 초 동안의 요청 시각을 보관하는 분당 요청 한도"""
+    def __init__(self, limit, window=60.0):
+        self.limit = limit
+        self.window = window
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        while self._calls and now - self._calls[0] >= self.window:
+            self._calls.popleft()
+
+    def acquire(self):
+        """한도 안이면 바로, 아니면 가장 오래된 요청이 윈도우를 벗어날 때까지 대기. 대기한 초 반환"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.time()
+                self._purge(now)
+                if len(self._calls) < self.limit:
+                    self._calls.append(now)
+                    return waited
+                delay = self.window - (now - self._calls[0])
+            time.sleep(delay)
+            waited += delay
+
+    def headroom(self):
+        with self._lock:
+            self._purge(time.time())
+            return self.limit - len(self._calls)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+def _copy_data(value):
+    """읽기 결과(리스트 / 딕셔너리 중첩)의 사본 - 한 호출자가 고쳐도 다른 호출자 결과는 그대로"""
+    if isinstance(value, dict): return {k: _copy_data(v) for k, v in value.items()}
+    if isinstance(value, list):
+        copied = copy.copy(value)  # ValueRange 등 리스트 하위 타입과 속성 유지
+        copied[:] = [_copy_data(v) for v in value]
+        return copied
+    return value
+
+
+class QuotaManager:
+    """할당량 / 재시도 / 중복 읽기 합치기 / 통계를 한 곳에서 관리"""
+    def __init__(self, reads_per_min=60, writes_per_min=60, max_retries=5, max_backoff=32.0):
+        self.budgets = {"read": QuotaBudget(reads_per_min), "write": QuotaBudget(writes_per_min)}
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self._flights = {}
+        self._flight_lock = threading.Lock()
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def _is_retryable(e, idempotent=True):
+        """idempotent=False: 서버가 이미 반영했을 수 있는 실패(5xx / 연결 끊김)는 재시도하지 않음"""
+        if isinstance(e, gspread.exceptions.APIError):
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            return status == QUOTA_STATUS or (idempotent and status in RETRY_STATUS)
+        return idempotent and isinstance(e, requests.exceptions.ConnectionError)
+
+    def _record(self, name, elapsed, waited, error):
+        with self._stats_lock:
+            rec = self._stats.setdefault(name, {"calls": 0, "total": 0.0, "max": 0.0, "waited": 0.0, "errors": 0})
+            rec["calls"] += 1
+            rec["total"] += elapsed
+            rec["max"] = max(rec["max"], elapsed)
+            rec["waited"] += waited
+            if error: rec["errors"] += 1
+
+    def _call_with_retry(self, kind, name, func, args, kwargs, idempotent=True):
+        attempt = 0
+        waited = 0.0
+        while True:
+            waited += self.budgets[kind].acquire()
+            started = time.time()
+            try:
+                result = func(*args, **kwargs)
+                self._record(name, time.time() - started, waited, False)
+                return result
+            except Exception as e:
+                self._record(name, time.time() - started, waited, True)
+                if attempt >= self.max_retries or not self._is_retryable(e, idempotent): raise
+                # 지수 백오프 + 지터 (1, 2, 4 ... 초, 최대 max_backoff)
+                delay = min(self.max_backoff, 2 ** attempt) * (0.5 + random.random())
+                time.sleep(delay)
+                waited += delay
+                attempt += 1
+
+    def call(self, kind, name, func, args, kwargs, flight_key=None, idempotent=True):
+        if flight_key is None:
+            return self._call_with_retry(kind, name, func, args, kwargs, idempotent)
+
+        # 같은 읽기가 진행 중이면 기다렸다가 결과 공유
+        with self._flight_lock:
+            flight = self._flights.get(flight_key)
+            owner = flight is None
+            if owner: flight = self._flights[flight_key] = _Flight()
+            else: flight.waiters += 1
+        if not owner:
+            flight.done.wait()
+            if flight.error: raise flight.error
+            return _copy_data(flight.result)
+        try:
+            flight.result = self._call_with_retry(kind, name, func, args, kwargs)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flight_lock:
+                self._flights.pop(flight_key, None)
+            flight.done.set()
+        # 공유한 호출자가 있으면 원본은 그대로 두고 사본 반환 (없으면 복사 비용 없음)
+        return _copy_data(flight.result) if flight.waiters else flight.result
+
+    def report(self):
+        """호출별 통계와 남은 할당량"""
+        with self._stats_lock:
+            calls = [
+                {"호출": name, "횟수": s["calls"], "평균(ms)": round(s["total"] / s["calls"] * 1000),
+                 "최대(ms)": round(s["max"] * 1000), "대기(s)": round(s["waited"], 1), "오류": s["errors"]}
+                for name, s in sorted(self._stats.items())
+            ]
+        headroom = {kind: b.headroom() for kind, b in self.budgets.items()}
+        return calls, headroom
+
+
+class _QuotaProxy:
+    """gspread 객체의 메서드 호출을 QuotaManager 를 거쳐 실행하는 프록시"""
+    def __init__(self, target, manager, label):
+        self._target = target
+        self._manager = manager
+        self._label = label
+        self.quota_manager = manager
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or (name not in READ_METHODS and name not in WRITE_METHODS):
+            return attr
+        kind = "read" if name in READ_METHODS else "write"
+        manager, label, target_id = self._manager, self._label, id(self._target)
+        # 워크시트 batch_update 는 값 덮어쓰기, 스프레드시트 batch_update 는 행 삭제 등 구조 변경
+        idempotent = kind == "read" or name in OVERWRITE_METHODS or (
+            name == "batch_update" and isinstance(self._target, gspread.Worksheet))
+
+        def _wrapped(*args, **kwargs):
+            flight_key = None
+            if kind == "read":
+                flight_key = (target_id, name, repr(args), repr(sorted(kwargs.items())))
+            result = manager.call(kind, f"{label}.{name}", attr, args, kwargs, flight_key, idempotent)
+            return _wrap_result(result, manager)
+        return _wrapped
+
+    def __repr__(self):
+        return f"<Quota {self._target!r}>"
+
+
+def _wrap_result(result, manager):
+    # 스프레드시트/워크시트 객체는 다시 프록시로 감싸서 반환
+    if isinstance(result, gspread.Spreadsheet):
+        return _QuotaProxy(result, manager, "spreadsheet")
+    if isinstance(result, gspread.Worksheet):
+        return _QuotaProxy(result, manager, result.title)
+    if isinstance(result, list) and result and isinstance(result[0], gspread.Worksheet):
+        return [_QuotaProxy(ws, manager, ws.title) for ws in result]
+    return result
+
+
+def wrap_client(client, reads_per_min=60, writes_per_min=60):
+    """gspread 클라이언트 -> 할당량 인식 클라이언트 (통계는 .quota_manager.report())"""
+    return _QuotaProxy(client, QuotaManager(reads_per_min, writes_per_min), "client")
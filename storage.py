@@ -0,0 +1,778 @@
+"""
+데이터 저장소 인터페이스
+- GoogleSheetsStorage: 기존 구글 시트 (gspread)
+- SQLiteStorage: 로컬 SQLite (대량 처리 / 오프라인 테스트 / 벤치마크용)
+두 구현 모두 시트 단위(자재마스터 / 발주내역 / 견적DB / 재고이력 ...)로 같은 메서드를 제공함
+행 번호는 구글 시트 기준 (1행 = 헤더, 데이터는 2행부터)
+"""
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import gspread
+import pandas as pd
+
+MAT_SHEET = "자재마스터"
+ORD_SHEET = "발주내역"
+QUOTE_SHEET = "견적DB"
+ARCHIVE_SHEET = "발주보관"  # 입고완료된 발주 행 보관용 (선택)
+LEDGER_SHEET = "재고이력"    # 재고 변동 (입고/출고/조정) - 행 추가만 함
+SNAPSHOT_SHEET = "재고스냅샷"  # 재고이력 압축 결과 (자재코드별 재고 + 기준 이력 행)
+REORDER_SHEET = "발주점"      # 자재별 발주점 / 발주량 (같은 자재코드는 아래 행이 우선)
+SHEET_NAMES = [MAT_SHEET, ORD_SHEET, QUOTE_SHEET, LEDGER_SHEET, SNAPSHOT_SHEET, REORDER_SHEET]
+
+REAL_SHEET_URL = "https://docs.google.com/spreadsheets/d/1UQ6_OysueJ07m6Qc5ncfE1NxPCLjc255r6MeFdl0OHQ/edit?gid=1122897158#gid=1122897158"
+
+MAT_HEADERS = ["자재코드", "품명", "규격", "적용설비", "단가", "매입처", "현재재고", "비고"]
+ORD_HEADERS = ["발주ID", "날짜", "거래처", "품명", "수량", "상태", "비고", "자재코드"]
+QUOTE_HEADERS = ["견적ID", "날짜", "설비", "용량", "메인", "서브", "방폭", "재질", "옵션", "총액"]
+LEDGER_HEADERS = ["일시", "자재코드", "구분", "수량", "참조", "비고"]
+SNAPSHOT_HEADERS = ["자재코드", "재고", "기준행", "일시"]
+REORDER_HEADERS = ["자재코드", "발주점", "발주량", "일시"]
+DEFAULT_HEADERS = {
+    MAT_SHEET: MAT_HEADERS, ORD_SHEET: ORD_HEADERS, QUOTE_SHEET: QUOTE_HEADERS, ARCHIVE_SHEET: ORD_HEADERS,
+    LEDGER_SHEET: LEDGER_HEADERS, SNAPSHOT_SHEET: SNAPSHOT_HEADERS, REORDER_SHEET: REORDER_HEADERS,
+}
+
+ORD_STATUS_COL = 6  # 발주내역 '상태' 열
+MAT_STOCK_COL = 7   # 자재마스터 '현재재고' 열
+
+META_SHEET = "_변경감지"
+
+# 로딩 시 1회만 변환하는 열 타입 (이후 화면/계산에서는 다시 변환하지 않음)
+INT_COLUMNS = {
+    MAT_SHEET: ["단가", "현재재고"], ORD_SHEET: ["수량"], LEDGER_SHEET: ["수량"], SNAPSHOT_SHEET: ["재고", "기준행"],
+    REORDER_SHEET: ["발주점", "발주량"],
+}
+CATEGORY_COLUMNS = {MAT_SHEET: ["매입처", "품명", "적용설비"]}  # 반복되는 텍스트 -> 범주형 (메모리 절약)
+
+def parse_order_rows(raw_data, row_nums=None):
+    """발주내역 get_all_values() 결과 -> DataFrame (인덱스 = 시트 행번호)"""
+    # 데이터 정제 (열 개수가 안 맞을 경우 보정)
+    clean_rows = []
+    for row in raw_data[1:]:
+        # 행 데이터가 헤더보다 짧으면 빈칸으로 채움
+        if len(row) < 8:
+            row = list(row) + [""] * (8 - len(row))
+        clean_rows.append(list(row[:8]))
+
+    # 인덱스 = 시트 행번호 (헤더가 1행이므로 2부터)
+    if row_nums is None: row_nums = range(2, len(clean_rows) + 2)
+    df = pd.DataFrame(clean_rows, columns=ORD_HEADERS, index=row_nums)
+    # '상태' 컬럼 공백 제거 (오류 방지)
+    df['상태'] = df['상태'].astype(str).str.strip()
+    return type_frame(ORD_SHEET, df)
+
+def same_value(current, expected):
+    """시트 값 비교 (구글 시트는 문자열, SQLite 는 숫자로 돌려주므로 문자열로 맞춰서)"""
+    return str("" if current is None else current).strip() == str(expected).strip()
+
+def row_ranges(row_nums):
+    """행번호 목록 -> 연속 구간 [(시작, 끝), ...]"""
+    ranges, start, prev = [], None, None
+    for r in sorted(set(row_nums)):
+        if start is None: start = prev = r
+        elif r == prev + 1: prev = r
+        else:
+            ranges.append((start, prev))
+            start = prev = r
+    if start is not None: ranges.append((start, prev))
+    return ranges
+
+def parse_int_column(series):
+    """'1,200' / '' / 숫자 혼합 열 -> int64 (변환 실패는 0)"""
+    text = series.astype(str).str.replace(',', '', regex=False).str.strip()
+    return pd.to_numeric(text, errors='coerce').fillna(0).astype('int64')
+
+def missing_columns(name, df):
+    return [c for c in DEFAULT_HEADERS.get(name, []) if c not in df.columns]
+
+def type_frame(name, df):
+    """
+    시트 DataFrame 의 열 타입을 한 번에 정리
+    - 수치 열(단가/현재재고/수량) -> int64, 반복 텍스트 열 -> category, 나머지 텍스트 -> str
+    - 없는 열은 건너뜀 (missing_columns() 로 확인)
+    """
+    if df.empty and not len(df.columns): return df
+    numeric = INT_COLUMNS.get(name, [])
+    categorical = CATEGORY_COLUMNS.get(name, [])
+    typed = {}
+    for col in df.columns:
+        text = df[col].where(df[col].notna(), "").astype(str)
+        if col in numeric: typed[col] = parse_int_column(text)
+        elif col in categorical: typed[col] = text.astype('category')
+        elif name in INT_COLUMNS: typed[col] = text
+        else: typed[col] = df[col]
+    return pd.DataFrame(typed, index=df.index)
+
+
+class Storage(ABC):
+    """저장소 공통 인터페이스"""
+
+    @abstractmethod
+    def read_frame(self, name):
+        """시트 전체 -> DataFrame (인덱스 = 시트 행번호)"""
+
+    @abstractmethod
+    def read_values(self, name):
+        """시트 전체 -> [헤더, 행1, 행2, ...] (동기화용)"""
+
+    @abstractmethod
+    def read_rows_from(self, name, start_row):
+        """start_row 행부터 끝까지 -> [(행번호, 값 리스트), ...] (증분 로딩용)"""
+
+    @abstractmethod
+    def append_rows(self, name, rows):
+        """시트 끝에 행 추가. return: 추가된 첫 행 번호 (알 수 없으면 None)"""
+
+    @abstractmethod
+    def delete_rows(self, name, row_nums):
+        """행 삭제 (구글 시트는 아래 행 번호가 당겨짐)"""
+
+    @abstractmethod
+    def update_cells(self, name, updates):
+        """updates: [(행번호, 열번호, 값), ...] 을 한 번에 반영"""
+
+    @abstractmethod
+    def update_cells_if(self, name, updates, expected):
+        """
+        조건부 일괄 업데이트 (낙관적 동시성 제어)
+        expected: {행번호: {열번호: 기대값}} - 현재 값이 기대값과 모두 같은 행의 업데이트만 반영
+        return: 충돌(값이 바뀌었거나 행이 없음)로 반영하지 않은 행번호 집합
+        """
+
+    @abstractmethod
+    def replace_all(self, name, values):
+        """
+        시트 내용을 [헤더, 행...] 으로 교체 (동기화용)
+        지우고 다시 쓰지 않음 -> 읽는 쪽에 빈 시트가 보이는 구간 없음, 남는 아래 행은 마지막에 잘라냄
+        """
+
+    @abstractmethod
+    def fingerprints(self):
+        """시트별 변경 감지용 지문 {시트명: 값} (가벼운 조회 1회)"""
+
+
+# -----------------------------------------------------
+# 구글 시트 구현
+# -----------------------------------------------------
+class GoogleSheetsStorage(Storage):
+    def __init__(self, sh, worksheets=None):
+        self.sh = sh
+        self._ws = dict(worksheets or {})
+        self._ws_meta = None
+        self._use_meta_sheet = True
+
+    def worksheet(self, name):
+        if name not in self._ws:
+            try: self._ws[name] = self.sh.worksheet(name)
+            except gspread.WorksheetNotFound:
+                if name not in DEFAULT_HEADERS: raise
+                headers = DEFAULT_HEADERS[name]
+                ws = self.sh.add_worksheet(title=name, rows=100, cols=len(headers))
+                ws.append_row(headers)
+                self._ws[name] = ws
+        return self._ws[name]
+
+    def read_frame(self, name):
+        ws = self.worksheet(name)
+        if name == ORD_SHEET:
+            return parse_order_rows(ws.get_all_values())
+        df = pd.DataFrame(ws.get_all_records())
+        df.index = range(2, len(df) + 2)
+        return type_frame(name, df)
+
+    def read_values(self, name):
+        return self.worksheet(name).get_all_values()
+
+    def read_rows_from(self, name, start_row):
+        ws = self.worksheet(name)
+        # 시트 격자(row_count) 밖에서 시작하는 범위는 API 가 거부하므로 요청하지 않음 (새로 추가된 행 없음)
+        # 다른 곳에서 행을 추가했으면 캐시된 row_count 가 작을 수 있으므로 시트 속성만 1회 다시 확인
+        if start_row > ws.row_count and start_row > self._grid_rows(ws): return []
+        width = len(DEFAULT_HEADERS.get(name, ORD_HEADERS))
+        last_col = gspread.utils.rowcol_to_a1(1, width)[:-1]
+        rows = ws.get(f"A{start_row}:{last_col}")
+        return [(start_row + i, list(r)) for i, r in enumerate(rows)]
+
+    def _grid_rows(self, ws):
+        meta = self.sh.fetch_sheet_metadata({"fields": "sheets.properties(sheetId,gridProperties.rowCount)"})
+        for sheet in meta.get('sheets', []):
+            if sheet['properties']['sheetId'] == ws.id:
+                return sheet['properties'].get('gridProperties', {}).get('rowCount', 0)
+        return 0
+
+    def append_rows(self, name, rows):
+        if not rows: return None
+        resp = self.worksheet(name).append_rows(rows)
+        # 응답의 updatedRange (예: '발주내역'!A51:H52) 에서 첫 행 번호
+        m = re.search(r"![A-Z]+(\d+)", str(((resp or {}).get('updates') or {}).get('updatedRange', "")))
+        return int(m.group(1)) if m else None
+
+    def delete_rows(self, name, row_nums):
+        if not row_nums: return
+        # 연속 구간으로 묶어서 아래쪽부터 삭제 (요청 1회)
+        ranges = row_ranges(row_nums)
+        sheet_id = self.worksheet(name).id
+        self.sh.batch_update({"requests": [
+            {"deleteDimension": {"range": {
+                "sheetId": sheet_id, "dimension": "ROWS", "startIndex": a - 1, "endIndex": b}}}
+            for a, b in reversed(ranges)
+        ]})
+
+    def update_cells(self, name, updates):
+        if not updates: return
+        self.worksheet(name).batch_update([
+            {'range': gspread.utils.rowcol_to_a1(row, col), 'values': [[value]]}
+            for row, col, value in updates
+        ], value_input_option='USER_ENTERED')
+
+    def update_cells_if(self, name, updates, expected):
+        if not updates: return set()
+        # 구글 시트에는 원자적 비교-교체가 없으므로 쓰기 직전에 대상 행만 1회 조회해서 비교
+        # (조회~쓰기 사이 왕복 1회만큼의 간격만 남음, 연속된 행은 구간 하나로 조회)
+        ws = self.worksheet(name)
+        width = max(col for cols in expected.values() for col in cols)
+        last_col = gspread.utils.rowcol_to_a1(1, width)[:-1]
+        ranges = row_ranges(expected)
+        current = {}
+        for (a, b), block in zip(ranges, ws.batch_get([f"A{a}:{last_col}{b}" for a, b in ranges])):
+            for i, values in enumerate(block):
+                current[a + i] = list(values)
+        conflicts = {
+            row for row, cols in expected.items()
+            if not all(same_value((current.get(row, []) + [""] * width)[col - 1], v) for col, v in cols.items())
+        }
+        self.update_cells(name, [u for u in updates if u[0] not in conflicts])
+        return conflicts
+
+    def replace_all(self, name, values):
+        ws = self.worksheet(name)
+        rows = max(len(values), 2)
+        width = max((len(r) for r in values), default=0)
+        if ws.row_count < rows or ws.col_count < width:
+            ws.resize(rows=max(ws.row_count, rows), cols=max(ws.col_count, width))
+        if values:
+            # 짧은 행은 빈칸으로 채워서 이전 값이 남지 않게 (값 쓰기 1회)
+            padded = [list(r) + [""] * (width - len(r)) for r in values]
+            ws.batch_update([{'range': 'A1', 'values': padded}], value_input_option='RAW')
+        if ws.row_count > rows: ws.resize(rows=rows)
+
+    # --- 변경 감지 ---
+    @staticmethod
+    def _checksum_formula(title):
+        rng = f"'{title}'!A:Z"
+        # 행 수 | 셀 길이 가중합 | 숫자 합계 -> 추가/삭제/수정 대부분을 감지
+        return f"=COUNTA('{title}'!A:A)&\"|\"&SUMPRODUCT(LEN({rng})*ROW({rng}))&\"|\"&SUM({rng})"
+
+    def _meta_sheet(self):
+        if self._ws_meta is None:
+            try: ws = self.sh.worksheet(META_SHEET)
+            except gspread.WorksheetNotFound:
+                ws = self.sh.add_worksheet(title=META_SHEET, rows=len(SHEET_NAMES) + 1, cols=2)
+                try: ws.hide()
+                except Exception: pass
+            # 감시 대상 시트가 늘어난 경우 (기존 '_변경감지' 시트) 행 수 확장
+            if ws.row_count < len(SHEET_NAMES): ws.resize(rows=len(SHEET_NAMES) + 1)
+            ws.batch_update([{
+                'range': f"A1:B{len(SHEET_NAMES)}",
+                'values': [[t, self._checksum_formula(t)] for t in SHEET_NAMES]
+            }], value_input_option='USER_ENTERED')
+            self._ws_meta = ws
+        return self._ws_meta
+
+    def fingerprints(self):
+        # '_변경감지' 시트의 체크섬 수식 값을 1회 조회로 읽음
+        if self._use_meta_sheet:
+            try:
+                rows = self._meta_sheet().get(f"A1:B{len(SHEET_NAMES)}")
+                return {r[0]: r[1] for r in rows if len(r) > 1}
+            except gspread.exceptions.APIError as e:
+                # 수식 시트를 만들 권한이 없을 때만 이후로 메타데이터 방식 사용 (429 / 5xx 등 일시적 오류는 그대로 전달)
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                if self._ws_meta is not None or status != 403: raise
+                self._use_meta_sheet = False
+        # 대체 (약함): 스프레드시트 메타데이터의 격자 행 수
+        # -> 행 삭제 / 격자 확장만 감지, 기존 격자 안에 추가한 행이나 셀 수정은 감지 못함 (새로고침 버튼 사용)
+        meta = self.sh.fetch_sheet_metadata()
+        return {
+            p['properties']['title']: str(p['properties'].get('gridProperties', {}).get('rowCount'))
+            for p in meta.get('sheets', []) if p['properties']['title'] in SHEET_NAMES
+        }
+
+def open_sheets(client, url=REAL_SHEET_URL):
+    """스프레드시트를 열고 워크시트 목록을 메타데이터 조회 1회로 가져와 저장소 생성 (견적DB 없으면 생성)"""
+    sh = client.open_by_url(url)
+    all_ws = {ws.title: ws for ws in sh.worksheets()}
+    missing = [name for name in (MAT_SHEET, ORD_SHEET) if name not in all_ws]
+    if missing: raise gspread.WorksheetNotFound(", ".join(missing))
+    ws_map = {name: all_ws[name] for name in SHEET_NAMES if name in all_ws}
+    if QUOTE_SHEET not in ws_map:
+        ws_map[QUOTE_SHEET] = sh.add_worksheet(title=QUOTE_SHEET, rows=100, cols=20)
+        ws_map[QUOTE_SHEET].append_row(QUOTE_HEADERS)
+    return GoogleSheetsStorage(sh, ws_map)
+
+
+# -----------------------------------------------------
+# 로컬 SQLite 구현
+# -----------------------------------------------------
+class SQLiteStorage(Storage):
+    """
+    시트 1개 = 테이블 1개 (row_no = 시트 행번호, 나머지 열 = 시트 헤더)
+    자재코드 / 발주ID / 상태 에 인덱스, 쓰기마다 _revisions 의 시트별 리비전 증가
+    """
+    INDEXED_COLUMNS = {
+        MAT_SHEET: ["자재코드"],
+        ORD_SHEET: ["발주ID", "상태", "자재코드"],
+        QUOTE_SHEET: ["견적ID"],
+        ARCHIVE_SHEET: ["발주ID"],
+        LEDGER_SHEET: ["자재코드"],
+        REORDER_SHEET: ["자재코드"],
+    }
+
+    def __init__(self, path="erp.db"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS _revisions (name TEXT PRIMARY KEY, rev INTEGER NOT NULL)")
+            # 구글 시트와 마지막으로 맞춘 시점의 양쪽 지문 (재시작해도 유지)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS _sync (name TEXT PRIMARY KEY, src TEXT, dst TEXT)")
+        for name in SHEET_NAMES + [ARCHIVE_SHEET]:
+            if not self.headers(name):
+                self._create_table(name, DEFAULT_HEADERS[name])
+
+    @staticmethod
+    def _q(ident):
+        return '"' + str(ident).replace('"', '""') + '"'
+
+    def headers(self, name):
+        cols = [r[1] for r in self._conn.execute(f"PRAGMA table_info({self._q(name)})")]
+        return [c for c in cols if c != "row_no"]
+
+    def _create_table(self, name, headers):
+        q = self._q
+        with self._conn:
+            self._conn.execute(f"DROP TABLE IF EXISTS {q(name)}")
+            cols = ", ".join(q(h) for h in headers)
+            self._conn.execute(f"CREATE TABLE {q(name)} (row_no INTEGER PRIMARY KEY, {cols})")
+            for col in self.INDEXED_COLUMNS.get(name, []):
+                if col in headers:
+                    self._conn.execute(f"CREATE INDEX {q(f'ix_{name}_{col}')} ON {q(name)} ({q(col)})")
+            self._bump(name)
+
+    def _bump(self, name):
+        self._conn.execute(
+            "INSERT INTO _revisions (name, rev) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET rev = rev + 1", (name,))
+
+    def _rows(self, name):
+        headers = self.headers(name)
+        cur = self._conn.execute(f"SELECT * FROM {self._q(name)} ORDER BY row_no")
+        return headers, [(r[0], ["" if v is None else v for v in r[1:]]) for r in cur]
+
+    def read_frame(self, name):
+        with self._lock:
+            headers, rows = self._rows(name)
+        row_nums = [r[0] for r in rows]
+        if name == ORD_SHEET:
+            # 시트와 동일하게 모든 값을 문자열로
+            return parse_order_rows([headers] + [[str(v) for v in r[1]] for r in rows], row_nums)
+        return type_frame(name, pd.DataFrame([r[1] for r in rows], columns=headers, index=row_nums))
+
+    def read_values(self, name):
+        with self._lock:
+            headers, rows = self._rows(name)
+        return [headers] + [r[1] for r in rows]
+
+    def read_rows_from(self, name, start_row):
+        with self._lock:
+            cur = self._conn.execute(
+                f"SELECT * FROM {self._q(name)} WHERE row_no >= ? ORDER BY row_no", (start_row,))
+            return [(r[0], ["" if v is None else v for v in r[1:]]) for r in cur]
+
+    def append_rows(self, name, rows):
+        if not rows: return None
+        with self._lock, self._conn:
+            headers = self.headers(name)
+            width = len(headers)
+            start = self._conn.execute(f"SELECT COALESCE(MAX(row_no), 1) FROM {self._q(name)}").fetchone()[0] + 1
+            placeholders = ", ".join("?" * (width + 1))
+            self._conn.executemany(
+                f"INSERT INTO {self._q(name)} VALUES ({placeholders})",
+                [[start + i] + (list(row) + [""] * width)[:width] for i, row in enumerate(rows)]
+            )
+            self._bump(name)
+        return start
+
+    def delete_rows(self, name, row_nums):
+        # SQLite 는 row_no 가 고정 키 -> 삭제해도 다른 행 번호는 그대로
+        if not row_nums: return
+        with self._lock, self._conn:
+            self._conn.executemany(f"DELETE FROM {self._q(name)} WHERE row_no = ?", [(r,) for r in row_nums])
+            self._bump(name)
+
+    def update_cells(self, name, updates):
+        if not updates: return
+        with self._lock, self._conn:
+            headers = self.headers(name)
+            for row, col, value in updates:
+                self._conn.execute(
+                    f"UPDATE {self._q(name)} SET {self._q(headers[col - 1])} = ? WHERE row_no = ?",
+                    (value, row))
+            self._bump(name)
+
+    def update_cells_if(self, name, updates, expected):
+        if not updates: return set()
+        # 행별로 기대값을 WHERE 조건에 넣은 UPDATE 1문장 -> 비교와 쓰기가 원자적 (다른 프로세스와도 안전)
+        by_row = {}
+        for row, col, value in updates:
+            by_row.setdefault(row, {})[col] = value
+        conflicts = set()
+        with self._lock, self._conn:
+            headers = self.headers(name)
+            q = self._q
+            for row, cols in by_row.items():
+                checks = expected.get(row, {})
+                sets = ", ".join(f"{q(headers[c - 1])} = ?" for c in cols)
+                where = "".join(f" AND TRIM(CAST({q(headers[c - 1])} AS TEXT)) = ?" for c in checks)
+                cur = self._conn.execute(
+                    f"UPDATE {q(name)} SET {sets} WHERE row_no = ?{where}",
+                    [*cols.values(), row, *(str(v).strip() for v in checks.values())])
+                if cur.rowcount == 0: conflicts.add(row)
+            self._bump(name)
+        return conflicts
+
+    def replace_all(self, name, values):
+        headers = list(values[0]) if values else DEFAULT_HEADERS[name]
+        with self._lock:
+            if headers != self.headers(name): self._create_table(name, headers)
+            # 삭제와 다시 넣기를 한 트랜잭션으로 -> 다른 연결에는 빈 테이블이 보이지 않음
+            width = len(headers)
+            placeholders = ", ".join("?" * (width + 1))
+            with self._conn:
+                self._conn.execute(f"DELETE FROM {self._q(name)}")
+                self._conn.executemany(
+                    f"INSERT INTO {self._q(name)} VALUES ({placeholders})",
+                    [[i + 2] + (list(row) + [""] * width)[:width] for i, row in enumerate(values[1:])]
+                )
+                self._bump(name)
+
+    def fingerprints(self):
+        with self._lock:
+            return {name: str(rev) for name, rev in self._conn.execute("SELECT name, rev FROM _revisions")}
+
+    def sync_state(self):
+        """{시트명: (로컬 지문, 원격 지문)} - 마지막 동기화 기준"""
+        with self._lock:
+            return {name: (a, b) for name, a, b in self._conn.execute("SELECT name, src, dst FROM _sync")}
+
+    def save_sync_state(self, name, src_fp, dst_fp):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO _sync (name, src, dst) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET src = excluded.src, dst = excluded.dst", (name, src_fp, dst_fp))
+
+    def is_empty(self):
+        with self._lock:
+            return all(
+                self._conn.execute(f"SELECT COUNT(*) FROM {self._q(n)}").fetchone()[0] == 0
+                for n in SHEET_NAMES)
+
+
+# -----------------------------------------------------
+# 저장소 간 동기화
+# -----------------------------------------------------
+def sync_storage(src, dst, names=SHEET_NAMES):
+    """src 의 시트 내용을 dst 로 복사 (예: 처음 만든 로컬 SQLite <- 구글 시트)"""
+    for name in names:
+        dst.replace_all(name, src.read_values(name))
+
+def _value_rows(values):
+    """시트 값 비교용 정규화 (문자열로 맞추고 끝의 빈칸 / 빈 행 무시)"""
+    rows = []
+    for row in values:
+        cells = ["" if v is None else str(v).strip() for v in row]
+        while cells and cells[-1] == "": cells.pop()
+        rows.append(cells)
+    while rows and not rows[-1]: rows.pop()
+    return rows
+
+def start_periodic_sync(src, dst, interval, on_error=None):
+    """
+    interval 초마다 src(로컬 SQLite) <-> dst(구글 시트) 동기화하는 백그라운드 스레드 시작
+    - 마지막으로 맞춘 시점의 양쪽 지문을 src 에 저장 (재시작해도 그 기준으로 비교)
+    - 지난 동기화 이후 지문이 바뀐 시트만 복사
+    - 한쪽만 바뀌었으면 바뀐 쪽 -> 다른 쪽 (앱이 꺼져 있는 동안 시트를 직접 고친 내용도 로컬로 가져옴)
+    - 양쪽 다 바뀌었으면 src(로컬)가 이김 -> 그 시트의 직접 수정은 덮어씀
+    - 기준 지문이 없는 시트(처음 동기화)는 내용을 비교해서 같으면 기준만 기록, 다르면 dst(시트)가 이김
+    - 시트 -> 로컬 반영은 로컬 잠금 안에서 로컬 지문을 다시 확인 (그 사이 로컬 쓰기가 있으면 이번 회는 건너뜀)
+    """
+    def _pull(name, values, expected_src):
+        """로컬이 그대로일 때만 시트 내용으로 교체 -> 교체 후 로컬 지문 (건너뛰면 None)"""
+        with src._lock:
+            if src.fingerprints().get(name) != expected_src: return None
+            src.replace_all(name, values)
+            return src.fingerprints().get(name)
+
+    def _run():
+        state = src.sync_state()
+        while True:
+            time.sleep(interval)
+            try:
+                src_fp, dst_fp = src.fingerprints(), dst.fingerprints()
+                for name in SHEET_NAMES:
+                    if name not in state:
+                        remote, synced_src = dst.read_values(name), src_fp.get(name)
+                        if _value_rows(remote) != _value_rows(src.read_values(name)):
+                            synced_src = _pull(name, remote, synced_src)
+                            if synced_src is None: continue
+                        state[name] = (synced_src, dst_fp.get(name))
+                        src.save_sync_state(name, *state[name])
+                        continue
+                    synced_src, synced_dst = state[name]
+                    src_changed = src_fp.get(name) != synced_src
+                    dst_changed = dst_fp.get(name) != synced_dst
+                    if dst_changed and not src_changed:
+                        pulled = _pull(name, dst.read_values(name), src_fp.get(name))
+                        if pulled is None: continue
+                        state[name] = (pulled, dst_fp.get(name))
+                    elif src_changed:
+                        dst.replace_all(name, src.read_values(name))
+                        state[name] = (src_fp.get(name), dst.fingerprints().get(name))
+                    else: continue
+                    src.save_sync_state(name, *state[name])
+            except Exception as e:
+                if on_error: on_error(e)
+    t = threading.Thread(target=_run, name="storage-sync", daemon=True)
+    t.start()
+    return t
+
+
+# -----------------------------------------------------
+# 발주내역 증분 로딩 + 입고 대기 색인
+# -----------------------------------------------------
+class OrderLog:
+    """
+    발주내역은 뒤로 추가만 되므로 마지막으로 읽은 행 이후만 조회
+    입고 대기('발주완료') 행만 {시트 행번호: 값} 으로 유지 -> 비용이 전체 이력이 아닌 미입고 건수에 비례
+    자재코드별 입고 대기 수량도 함께 유지 (바뀐 자재코드는 take_changed() 로 가져감)
+    행 삭제/중간 수정 등 외부 변경이 감지되면 reset() 후 전체 재로딩
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.last_row = 1     # 마지막으로 읽은 행 (1 = 헤더)
+            self.pending = {}     # 행번호 -> 8열 값 리스트
+            self.open_qty = {}    # 자재코드 -> 입고 대기 수량
+            self._changed = None  # 마지막 take_changed() 이후 바뀐 자재코드 (None = 전체)
+
+    def _mark(self, row, sign):
+        code = row[7].strip()
+        if not code: return
+        self.open_qty[code] = self.open_qty.get(code, 0) + sign * _int_value(row[4])
+        if self.open_qty[code] == 0: del self.open_qty[code]
+        if self._changed is not None: self._changed.add(code)
+
+    def refresh(self, storage):
+        """새로 추가된 행만 읽어서 색인 갱신"""
+        with self._lock:
+            for row_no, row in storage.read_rows_from(ORD_SHEET, self.last_row + 1):
+                row = ["" if v is None else str(v) for v in row]
+                row = (row + [""] * 8)[:8]
+                if row[ORD_STATUS_COL - 1].strip() == "발주완료":
+                    self.pending[row_no] = row
+                    self._mark(row, 1)
+                self.last_row = max(self.last_row, row_no)
+
+    def close_rows(self, row_nums):
+        """이 앱에서 상태를 바꾼 행을 색인에서 제거 (재조회 없음)"""
+        with self._lock:
+            for r in row_nums:
+                row = self.pending.pop(r, None)
+                if row is not None: self._mark(row, -1)
+
+    def take_changed(self):
+        """마지막 호출 이후 입고 대기 수량이 바뀐 자재코드 집합 (None = 초기화돼서 전체)"""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            return changed
+
+    def has_history(self):
+        return self.last_row > 1
+
+    def pending_frame(self):
+        with self._lock:
+            row_nums = sorted(self.pending)
+            rows = [self.pending[r] for r in row_nums]
+        return parse_order_rows([ORD_HEADERS] + rows, row_nums)
+
+def archive_closed_orders(storage):
+    """입고완료 등 '발주완료'가 아닌 발주 행을 보관 시트로 옮기고 발주내역에서 삭제. 옮긴 행 수 반환"""
+    closed_rows, closed_nums = [], []
+    for row_no, row in storage.read_rows_from(ORD_SHEET, 2):
+        row = (list(row) + [""] * 8)[:8]
+        status = str(row[ORD_STATUS_COL - 1]).strip()
+        if any(str(v).strip() for v in row) and status != "발주완료":
+            closed_rows.append(row)
+            closed_nums.append(row_no)
+    if closed_rows:
+        # 보관 시트에 먼저 쓰고 나서 삭제 (중간 실패 시 유실 대신 중복)
+        storage.append_rows(ARCHIVE_SHEET, closed_rows)
+        storage.delete_rows(ORD_SHEET, closed_nums)
+    return len(closed_rows)
+
+
+# -----------------------------------------------------
+# 재고 원장 (재고이력 추가 + 주기적 스냅샷)
+# -----------------------------------------------------
+MOVE_RECEIPT = "입고"
+MOVE_ISSUE = "출고"
+MOVE_ADJUST = "조정"
+OPENING_REF = "기초재고"  # 자재 등록 시 시작 재고 (참조 열)
+
+def _int_value(val):
+    try: return int(float(str(val).replace(',', '').strip() or 0))
+    except ValueError: return 0
+
+def stock_movement(mat_code, kind, qty, ref="", note=""):
+    """재고이력 1행 (출고는 음수 수량으로 기록)"""
+    qty = int(qty)
+    if kind == MOVE_ISSUE: qty = -abs(qty)
+    return [time.strftime("%Y-%m-%d %H:%M:%S"), str(mat_code), kind, qty, str(ref), str(note)]
+
+def opening_movements(mat_rows):
+    """새로 등록하는 자재마스터 행 -> 시작 재고 조정 이력 (현재재고 0 은 생략)"""
+    return [
+        stock_movement(r[0], MOVE_ADJUST, _int_value(r[MAT_STOCK_COL - 1]), OPENING_REF)
+        for r in mat_rows if len(r) >= MAT_STOCK_COL and _int_value(r[MAT_STOCK_COL - 1])
+    ]
+
+def latest_snapshot(values):
+    """재고스냅샷 행들 -> (기준행, {자재코드: 재고}) - 기준행이 가장 큰 세대만 사용"""
+    rows = [r for r in values if r and str(r[0]).strip() and len(r) > 2]
+    if not rows: return 1, None
+    base_row = max(_int_value(r[2]) for r in rows)
+    return base_row or 1, {str(r[0]).strip(): _int_value(r[1]) for r in rows if _int_value(r[2]) == base_row}
+
+class StockLedger:
+    """
+    현재재고 = 재고스냅샷 + 스냅샷 기준행 이후 재고이력 합계
+    - 재고 변경은 재고이력에 행을 추가만 함 (읽고-고치고-쓰기 없음 -> 동시에 입고해도 유실 없음)
+    - 새로 추가된 이력 행만 읽어서 합계 갱신 (증분)
+    - 재고의 기준은 재고스냅샷 + 재고이력 (자재마스터 '현재재고' 열은 압축 때 다시 쓰는 사본)
+    - 스냅샷에 없는 자재코드는 자재마스터 '현재재고' 열을 시작값으로 사용 (기존 시트 이관 / 스냅샷 이후 등록)
+      단, 그 자재의 기초재고 이력이 나오면 이력 쪽 값으로 대체 (중복 합산 없음)
+    - 재고가 바뀐 자재코드는 take_changed() 로 가져감 (발주점 판정 등 증분 갱신용)
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        self.base = None      # 스냅샷 재고 {자재코드: 수량}
+        self.base_row = 1     # 스냅샷에 반영된 마지막 이력 행
+        self.last_row = 1     # 마지막으로 읽은 이력 행
+        self.delta = {}       # 스냅샷 이후 변동 합계
+        self._changed = None  # 마지막 take_changed() 이후 바뀐 자재코드 (None = 전체)
+        self._fallback = set()  # 자재마스터 '현재재고' 를 시작값으로 쓴 자재코드
+        self._opened = set()    # 스냅샷 이후 기초재고 이력이 반영된 자재코드
+
+    def _load_base(self, storage):
+        self.base_row, snapshot = latest_snapshot(storage.read_values(SNAPSHOT_SHEET)[1:])
+        self.base = dict(snapshot or {})
+        self._fallback, self._opened = set(), set()
+        for r in storage.read_values(MAT_SHEET)[1:]:
+            code = str(r[0]).strip() if r else ""
+            if code and code not in self.base and len(r) >= MAT_STOCK_COL:
+                self.base[code] = _int_value(r[MAT_STOCK_COL - 1])
+                self._fallback.add(code)
+        self.last_row = self.base_row
+        self.delta = {}
+        self._changed = None
+
+    def refresh(self, storage):
+        """새로 추가된 재고이력만 읽어서 합계 갱신"""
+        with self._lock:
+            if self.base is None: self._load_base(storage)
+            for row_no, row in storage.read_rows_from(LEDGER_SHEET, self.last_row + 1):
+                row = (list(row) + [""] * 5)[:5]
+                code = str(row[1]).strip()
+                if code and str(row[4]).strip() == OPENING_REF:
+                    # 기초재고는 자재당 1번만: 마스터 값 대신 사용, 이미 스냅샷/이력에 있으면 무시
+                    if code in self._fallback:
+                        self.base.pop(code, None)
+                        self._fallback.discard(code)
+                    elif code in self.base or code in self._opened: code = ""
+                    if code: self._opened.add(code)
+                if code:
+                    self.delta[code] = self.delta.get(code, 0) + _int_value(row[3])
+                    if self._changed is not None: self._changed.add(code)
+                self.last_row = max(self.last_row, row_no)
+
+    def take_changed(self):
+        """마지막 호출 이후 재고가 바뀐 자재코드 집합 (None = 기준값을 새로 읽어서 전체)"""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            return changed
+
+    def stock_of(self, code):
+        with self._lock:
+            return (self.base or {}).get(code, 0) + self.delta.get(code, 0)
+
+    def stock(self):
+        with self._lock:
+            result = dict(self.base or {})
+            for code, qty in self.delta.items():
+                result[code] = result.get(code, 0) + qty
+            return result
+
+    def stock_frame(self):
+        stock = self.stock()
+        return pd.DataFrame({"자재코드": list(stock), "현재재고": pd.Series(list(stock.values()), dtype="int64")})
+
+def compact_stock(storage, ledger):
+    """
+    재고이력을 스냅샷으로 압축 (이력 행은 지우지 않음)
+    - 새 세대(기준행)를 행 추가 1회로 쓴 뒤 이전 세대 행을 삭제 -> 읽는 쪽은 항상 완성된 최신 세대만 봄
+    - 자재마스터 '현재재고' 열을 스냅샷 값으로 맞춤 (다른 값만, 일괄 1회)
+      -> 시트를 보는 사람용 사본, 이 열을 직접 고친 값은 덮어씀 (재고 수정은 '조정' 이력으로)
+    - 지난 압축 이후 바뀐 게 없으면 쓰지 않음
+    """
+    with ledger._lock:
+        ledger.refresh(storage)
+        stock, last_row = ledger.stock(), ledger.last_row
+        if last_row == ledger.base_row and not ledger._fallback: return len(stock)
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        storage.append_rows(SNAPSHOT_SHEET, [[code, qty, last_row, now] for code, qty in stock.items()])
+        ledger.base, ledger.base_row, ledger.delta = stock, last_row, {}
+        ledger._fallback, ledger._opened = set(), set()
+    old = [row_no for row_no, r in storage.read_rows_from(SNAPSHOT_SHEET, 2) if len(r) < 3 or _int_value(r[2]) < last_row]
+    storage.delete_rows(SNAPSHOT_SHEET, old)
+    updates = []
+    for row_no, row in storage.read_rows_from(MAT_SHEET, 2):
+        code = str(row[0]).strip() if row else ""
+        if code in stock and (len(row) < MAT_STOCK_COL or _int_value(row[MAT_STOCK_COL - 1]) != stock[code]):
+            updates.append((row_no, MAT_STOCK_COL, stock[code]))
+    storage.update_cells(MAT_SHEET, updates)
+    return len(stock)
+
+def start_periodic_compaction(storage, ledger, interval, on_error=None, on_done=None):
+    """interval 초마다 재고이력을 스냅샷으로 압축하는 백그라운드 스레드 시작 (on_done: 압축 후 호출)"""
+    def _run():
+        while True:
+            time.sleep(interval)
+            try:
+                compact_stock(storage, ledger)
+                if on_done: on_done()
+            except Exception as e:
+                if on_error: on_error(e)
+    t = threading.Thread(target=_run, name="stock-compaction", daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,207 @@
+"""
+시트 쓰기 지연 반영(write-behind) 큐
+- 쓰기 요청을 로컬 SQLite 파일에 저장하고 즉시 반환 (UI 가 네트워크를 기다리지 않음)
+- 백그라운드 스레드가 순서대로 저장소에 반영, 같은 시트에 연속된 append 는 append_rows 1회로 합침
+- 실패 시 지수 백오프로 재시도, 큐가 파일에 남아 있으므로 재시작해도 유실 없음
+- 응답만 유실된 append 를 다시 보내 행이 중복되지 않도록, 한 번 시도한 묶음은 같은 묶음으로 고정하고
+  재시도 전에 마지막으로 확인된 시트 끝 이후 행에 이미 들어가 있는지 확인 (완전히 같은 행 묶음이 있으면 반영된 것으로 봄)
+- 다시 보내도 성공할 수 없는 실패 (429 외 4xx / 없는 시트 / 잘못된 값) 는 dead 테이블로 옮기고 다음 요청을 계속 반영
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+
+import gspread
+
+TAIL_CHECK_ROWS = 1000  # 재시도 시 이미 반영됐는지 확인할 시트 끝 여유 행 수
+
+def _row_key(row):
+    # 시트는 문자열, SQLite 는 숫자로 돌려주므로 문자열로 맞추고 끝의 빈칸 무시
+    values = ["" if v is None else str(v).strip() for v in row]
+    while values and values[-1] == "": values.pop()
+    return tuple(values)
+
+def _json_default(obj):
+    # numpy 정수/실수 등
+    if hasattr(obj, 'item'): return obj.item()
+    return str(obj)
+
+def is_permanent_error(e):
+    """다시 보내도 같은 결과인 실패 (요청 자체가 잘못됨) - 재시도하지 않고 dead 로 옮김"""
+    if isinstance(e, gspread.exceptions.APIError):
+        status = getattr(getattr(e, 'response', None), 'status_code', None)
+        return status is not None and 400 <= status < 500 and status != 429
+    if isinstance(e, sqlite3.OperationalError): return "no such" in str(e)  # 'database is locked' 등은 일시적
+    return isinstance(e, (gspread.exceptions.WorksheetNotFound, sqlite3.IntegrityError, sqlite3.ProgrammingError,
+                          ValueError, TypeError, KeyError, IndexError))
+
+
+class WriteBehindQueue:
+    def __init__(self, storage, path="write_queue.db", on_flush=None, batch_limit=500, max_backoff=60):
+        self.storage = storage
+        self.on_flush = on_flush  # 반영 완료된 시트명 목록을 받는 콜백 (캐시 무효화용)
+        self.batch_limit = batch_limit
+        self.max_backoff = max_backoff
+        self.last_flush = None    # 마지막 성공 시각 (epoch)
+        self.last_error = None
+        self.failures = 0
+        self._single = False      # 묶음이 영구 실패하면 원인 요청을 찾도록 1건씩 반영
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ops ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, sheet TEXT NOT NULL, kind TEXT NOT NULL, "
+                "payload TEXT NOT NULL, created REAL NOT NULL, batch INTEGER, since INTEGER)")
+            # 예전 큐 파일 (batch / since 열 없음)
+            cols = [r[1] for r in self._conn.execute("PRAGMA table_info(ops)")]
+            for col in ("batch", "since"):
+                if col not in cols: self._conn.execute(f"ALTER TABLE ops ADD COLUMN {col} INTEGER")
+            # 반영하지 못한 요청 (확인 후 수동 처리)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dead ("
+                "id INTEGER PRIMARY KEY, sheet TEXT NOT NULL, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+                "created REAL NOT NULL, failed REAL NOT NULL, error TEXT)")
+            # 시트별로 이 큐가 마지막으로 추가한 행 다음 번호 (재시도 시 그 이후만 읽음)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS tails (sheet TEXT PRIMARY KEY, next_row INTEGER NOT NULL)")
+        self._thread = None
+
+    # --- 쓰기 요청 (즉시 반환) ---
+    def _enqueue(self, sheet, kind, payload):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO ops (sheet, kind, payload, created) VALUES (?, ?, ?, ?)",
+                (sheet, kind, json.dumps(payload, ensure_ascii=False, default=_json_default), time.time()))
+        self._wake.set()
+
+    def append_rows(self, sheet, rows):
+        if rows: self._enqueue(sheet, "append", [list(r) for r in rows])
+
+    def pending_rows(self, sheet):
+        """아직 반영되지 않은 추가 행 목록 (중복 등록 확인용)"""
+        with self._lock:
+            ops = self._conn.execute(
+                "SELECT payload FROM ops WHERE sheet = ? AND kind = 'append' ORDER BY id", (sheet,)).fetchall()
+        return [row for (payload,) in ops for row in json.loads(payload)]
+
+    # --- 상태 ---
+    def depth(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ops").fetchone()[0]
+
+    def dead_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM dead").fetchone()[0]
+
+    def status(self):
+        return {
+            "depth": self.depth(),
+            "dead": self.dead_count(),
+            "last_flush": self.last_flush,
+            "last_error": self.last_error,
+            "failures": self.failures,
+        }
+
+    # --- 반영 ---
+    def _next_batch(self):
+        """
+        맨 앞에서부터 같은 시트/같은 종류로 연속된 요청을 묶어서 반환
+        이미 시도한 묶음(batch 표시)은 나중에 들어온 요청을 섞지 않고 그대로 다시 만듦
+        """
+        with self._lock:
+            ops = self._conn.execute(
+                "SELECT id, sheet, kind, payload, batch, since FROM ops ORDER BY id LIMIT ?",
+                (1 if self._single else self.batch_limit,)).fetchall()
+        if not ops: return None
+        _, sheet, kind, _, tag, since = ops[0]
+        ids, items = [], []
+        for op_id, op_sheet, op_kind, payload, op_tag, _ in ops:
+            if op_sheet != sheet or op_kind != kind or op_tag != tag: break
+            ids.append(op_id)
+            items.extend(json.loads(payload))
+        return sheet, kind, ids, items, tag is not None, since
+
+    def _tail_row(self, sheet):
+        # self._lock 안에서 호출
+        row = self._conn.execute("SELECT next_row FROM tails WHERE sheet = ?", (sheet,)).fetchone()
+        return row[0] if row else None
+
+    def _already_appended(self, sheet, items, since):
+        """묶음의 행들이 since 행 이후에 연속으로 이미 있는지 (이전 시도가 반영됐는데 응답만 유실된 경우)"""
+        if since:
+            # 그 사이 위쪽 행이 삭제(보관)됐을 수 있으므로 여유를 두고 읽음
+            tail = [_row_key(r) for _, r in self.storage.read_rows_from(sheet, max(2, since - TAIL_CHECK_ROWS))]
+        else:
+            # 이 큐가 이 시트에 추가한 적이 없으면 끝 위치를 모름 -> 전체를 읽어 끝부분만 비교
+            tail = [_row_key(r) for r in self.storage.read_values(sheet)[1:][-(len(items) + TAIL_CHECK_ROWS):]]
+        target = [_row_key(r) for r in items]
+        n = len(target)
+        return any(tail[i:i + n] == target for i in range(len(tail) - n, -1, -1))
+
+    def _move_to_dead(self, ids, error):
+        with self._lock, self._conn:
+            marks = ", ".join("?" * len(ids))
+            self._conn.execute(
+                f"INSERT INTO dead (id, sheet, kind, payload, created, failed, error) "
+                f"SELECT id, sheet, kind, payload, created, ?, ? FROM ops WHERE id IN ({marks})",
+                [time.time(), str(error), *ids])
+            self._conn.execute(f"DELETE FROM ops WHERE id IN ({marks})", ids)
+
+    def flush_once(self):
+        """묶음 1개를 반영. 반영할 게 없으면 False (영구 실패한 요청은 dead 로 옮기고 True)"""
+        batch = self._next_batch()
+        if batch is None: return False
+        sheet, kind, ids, items, retried, since = batch
+        try:
+            if kind != "append": raise ValueError(f"알 수 없는 요청 종류: {kind}")
+            if not (retried and self._already_appended(sheet, items, since)):
+                # 보내기 전에 묶음과 현재 시트 끝 위치를 고정 (재시도 때 그 이후만 읽어서 중복 여부 확인)
+                with self._lock, self._conn:
+                    self._conn.executemany(
+                        "UPDATE ops SET batch = ?, since = ? WHERE id = ?",
+                        [(ids[0], self._tail_row(sheet), i) for i in ids])
+                start = self.storage.append_rows(sheet, items)
+                if start:
+                    with self._lock, self._conn:
+                        self._conn.execute(
+                            "INSERT INTO tails (sheet, next_row) VALUES (?, ?) "
+                            "ON CONFLICT(sheet) DO UPDATE SET next_row = excluded.next_row", (sheet, start + len(items)))
+        except Exception as e:
+            if not is_permanent_error(e): raise
+            if len(ids) > 1:
+                # 묶음 중 어느 요청이 원인인지 모르므로 1건씩 다시 시도
+                self._single = True
+                return True
+            self._move_to_dead(ids, e)
+            self._single = False
+            self.last_error = None
+            return True
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM ops WHERE id = ?", [(i,) for i in ids])
+        self.last_flush = time.time()
+        self.last_error = None
+        self.failures = 0
+        if self.on_flush: self.on_flush([sheet])
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                self._wake.clear()
+                while self.flush_once(): pass
+                self._wake.wait(timeout=5)
+            except Exception as e:
+                self.last_error = str(e)
+                self.failures += 1
+                # 지수 백오프 + 지터
+                delay = min(self.max_backoff, 2 ** min(self.failures, 6)) * (0.5 + random.random() / 2)
+                time.sleep(delay)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+        return self